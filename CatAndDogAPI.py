@@ -1,238 +1,1691 @@
 import os
+import gc
+import json
+import math
+import mmap
+import argparse
+import cProfile
+import functools
+import hashlib
+import heapq
+import contextlib
+import ctypes
+import tracemalloc
+import time
+import bisect
+import codecs
+import random
+import queue
+import signal
+import sys
+import socket
+import threading
+import sqlite3
 import asyncio
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from multiprocessing import shared_memory
+from urllib.parse import urlencode
 import aiohttp
+import numpy as np
+from aiohttp import web
 from dotenv import load_dotenv
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 load_dotenv()
 
-api_url_cats = 'https://api.api-ninjas.com/v1/cats'
-api_url_dogs = 'https://api.api-ninjas.com/v1/dogs'
+API_BASE_URL = os.getenv('API_BASE_URL', 'https://api.api-ninjas.com')
+
+api_url_cats = f'{API_BASE_URL}/v1/cats'
+api_url_dogs = f'{API_BASE_URL}/v1/dogs'
 
 X_API_KEY = os.getenv('X_API_KEY')
 
-async def get_breeds_cats_inf(session, breed):
-    headers = {
-        'X-Api-Key': X_API_KEY,
-        'User-Agent': 'Chrome/91.0.4472.124',
-        'Accept': 'application/json'
-    }
-    params = {'name': breed['name']}
-    try:
-        async with session.get(api_url_cats, headers=headers, params=params) as response:
-            if response.status == 200:
-                json = await response.json()
-                if json and isinstance(json, list) and len(json) > 0:
-                    info = json[0]
-                    return (
-                        breed['name'],
-                        info.get('image_link', 'N/A'),
-                        info.get('length', 'N/A'),
-                        info.get('origin', 'N/A'),
-                        info.get('min_weight', 'N/A'),
-                        info.get('max_weight', 'N/A'),
-                        info.get('min_life_expectancy', 'N/A'),
-                        info.get('max_life_expectancy', 'N/A'),
-                        info.get('shedding', 'N/A'),
-                        info.get('family_friendly', 'N/A'),
-                        info.get('playfulness', 'N/A'),
-                        info.get('grooming', 'N/A'),
-                        info.get('other_pets_friendly', 'N/A'),
-                        info.get('children_friendly', 'N/A'),
-                        info.get('intelligence', 'N/A'),
-                        info.get('general_health', 'N/A')
-                    )
-            return (breed['name'],) + ('N/A',) * 10
+HEADERS = {
+    'X-Api-Key': X_API_KEY,
+    'User-Agent': 'Chrome/91.0.4472.124',
+    'Accept': 'application/json'
+}
+
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', 10))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+
+METRICS_ENABLED = os.getenv('METRICS', '0') == '1'
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH')
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', 60))
+PROFILE_MODE = os.getenv('PROFILE')
+PROFILE_OUTPUT = os.getenv('PROFILE_OUTPUT', 'CatAndDogAPI.prof')
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+class Metrics:
+    def __init__(self, prefix='catanddog'):
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.callbacks = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, delta, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def gauge_callback(self, name, callback):
+        self.callbacks[name] = callback
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def timed(self, stage):
+        def decorator(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return function(*args, **kwargs)
+                    finally:
+                        self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+            return wrapper
+        return decorator
+
+    def trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_start(session, context, params):
+            context.connection_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self.observe('stage_seconds', time.perf_counter() - context.connection_started, stage='connect')
+
+        async def on_connection_reuseconn(session, context, params):
+            self.inc('connections', result='reused')
+
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return [trace_config]
+
+    def render_prometheus(self):
+        def labels_text(labels, extra=()):
+            pairs = [f'{key}="{value}"' for key, value in labels + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f'{self.prefix}_{name}_total{labels_text(labels)} {value}')
+        gauges = dict(self.gauges)
+        for name, callback in self.callbacks.items():
+            gauges[(name, ())] = callback()
+        for (name, labels), value in sorted(gauges.items()):
+            lines.append(f'{self.prefix}_{name}{labels_text(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{self.prefix}_{name}_bucket{labels_text(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.prefix}_{name}_sum{labels_text(labels)} {histogram.total:.6f}')
+            lines.append(f'{self.prefix}_{name}_count{labels_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        def key_text(name, labels):
+            return name + ''.join(f',{key}={value}' for key, value in labels)
+
+        gauges = {key_text(name, labels): value for (name, labels), value in self.gauges.items()}
+        gauges.update({name: callback() for name, callback in self.callbacks.items()})
+        return {
+            'time': time.time(),
+            'counters': {key_text(name, labels): value for (name, labels), value in self.counters.items()},
+            'gauges': gauges,
+            'histograms': {key_text(name, labels): {
+                'count': histogram.count,
+                'sum': round(histogram.total, 6),
+                'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], histogram.counts))
+            } for (name, labels), histogram in self.histograms.items()}
+        }
+
+class NullMetrics:
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def gauge(self, name, delta, **labels):
+        pass
+
+    def gauge_callback(self, name, callback):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timed(self, stage):
+        return lambda function: function
+
+    def trace_config(self):
+        return None
+
+metrics = Metrics() if METRICS_ENABLED else NullMetrics()
+
+def write_metrics_dump(path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics.to_json(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+async def dump_metrics(path, interval=METRICS_DUMP_INTERVAL):
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            write_metrics_dump(path)
+    finally:
+        write_metrics_dump(path)
+
+@contextlib.asynccontextmanager
+async def metrics_dump(path=METRICS_DUMP_PATH):
+    task = asyncio.create_task(dump_metrics(path)) if METRICS_ENABLED and path else None
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+@contextlib.contextmanager
+def profiling(mode=PROFILE_MODE, output=PROFILE_OUTPUT):
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output)
+            print(f"Профиль cProfile сохранён в {output}")
+    elif mode == 'tracemalloc':
+        tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(output, 'w', encoding='utf-8') as f:
+                f.write(f'current={current} peak={peak}\n')
+                for stat in snapshot.statistics('traceback')[:50]:
+                    f.write(f'\n{stat}\n')
+                    f.write('\n'.join(stat.traceback.format()) + '\n')
+            print(f"Отчёт tracemalloc сохранён в {output}")
+    else:
+        yield
+
+def create_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True
+    )
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS, trace_configs=metrics.trace_config())
+
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', 24 * 60 * 60))
+CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', 60 * 60))
+
+breed_catalog = {'cat': {}, 'dog': {}}
+
+def normalize_name(name):
+    return ' '.join(name.split()).casefold()
+
+def parse_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_str(value):
+    return str(value) if value not in (None, '') else None
+
+def fmt(value):
+    if value is None:
+        return 'N/A'
+    if isinstance(value, float):
+        return f'{value:g}'
+    return str(value)
+
+@dataclass(frozen=True, slots=True)
+class CatBreed:
+    name: str
+    image_link: str | None = None
+    length: str | None = None
+    origin: str | None = None
+    min_weight: float | None = None
+    max_weight: float | None = None
+    min_life_expectancy: float | None = None
+    max_life_expectancy: float | None = None
+    shedding: int | None = None
+    family_friendly: int | None = None
+    playfulness: int | None = None
+    grooming: int | None = None
+    other_pets_friendly: int | None = None
+    children_friendly: int | None = None
+    intelligence: int | None = None
+    general_health: int | None = None
+
+    @classmethod
+    def from_json(cls, info, name=None):
+        return cls(
+            name=name or info['name'],
+            image_link=parse_str(info.get('image_link')),
+            length=parse_str(info.get('length')),
+            origin=parse_str(info.get('origin')),
+            min_weight=parse_float(info.get('min_weight')),
+            max_weight=parse_float(info.get('max_weight')),
+            min_life_expectancy=parse_float(info.get('min_life_expectancy')),
+            max_life_expectancy=parse_float(info.get('max_life_expectancy')),
+            shedding=parse_int(info.get('shedding')),
+            family_friendly=parse_int(info.get('family_friendly')),
+            playfulness=parse_int(info.get('playfulness')),
+            grooming=parse_int(info.get('grooming')),
+            other_pets_friendly=parse_int(info.get('other_pets_friendly')),
+            children_friendly=parse_int(info.get('children_friendly')),
+            intelligence=parse_int(info.get('intelligence')),
+            general_health=parse_int(info.get('general_health'))
+        )
+
+@dataclass(frozen=True, slots=True)
+class DogBreed:
+    name: str
+    image_link: str | None = None
+    min_height_male: float | None = None
+    max_height_male: float | None = None
+    min_weight_male: float | None = None
+    max_weight_male: float | None = None
+    min_height_female: float | None = None
+    max_height_female: float | None = None
+    min_weight_female: float | None = None
+    max_weight_female: float | None = None
+    min_life_expectancy: float | None = None
+    max_life_expectancy: float | None = None
+    shedding: int | None = None
+    barking: int | None = None
+    energy: int | None = None
+    protectiveness: int | None = None
+    trainability: int | None = None
+    good_with_children: int | None = None
+    good_with_other_dogs: int | None = None
+    good_with_strangers: int | None = None
+    grooming: int | None = None
+    drooling: int | None = None
+    coat_length: int | None = None
+    playfulness: int | None = None
+
+    @classmethod
+    def from_json(cls, info, name=None):
+        return cls(
+            name=name or info['name'],
+            image_link=parse_str(info.get('image_link')),
+            min_height_male=parse_float(info.get('min_height_male')),
+            max_height_male=parse_float(info.get('max_height_male')),
+            min_weight_male=parse_float(info.get('min_weight_male')),
+            max_weight_male=parse_float(info.get('max_weight_male')),
+            min_height_female=parse_float(info.get('min_height_female')),
+            max_height_female=parse_float(info.get('max_height_female')),
+            min_weight_female=parse_float(info.get('min_weight_female')),
+            max_weight_female=parse_float(info.get('max_weight_female')),
+            min_life_expectancy=parse_float(info.get('min_life_expectancy')),
+            max_life_expectancy=parse_float(info.get('max_life_expectancy')),
+            shedding=parse_int(info.get('shedding')),
+            barking=parse_int(info.get('barking')),
+            energy=parse_int(info.get('energy')),
+            protectiveness=parse_int(info.get('protectiveness')),
+            trainability=parse_int(info.get('trainability')),
+            good_with_children=parse_int(info.get('good_with_children')),
+            good_with_other_dogs=parse_int(info.get('good_with_other_dogs')),
+            good_with_strangers=parse_int(info.get('good_with_strangers')),
+            grooming=parse_int(info.get('grooming')),
+            drooling=parse_int(info.get('drooling')),
+            coat_length=parse_int(info.get('coat_length')),
+            playfulness=parse_int(info.get('playfulness'))
+        )
+
+BREED_TYPES = {'cat': CatBreed, 'dog': DogBreed}
+
+def parse_breed(species, info):
+    return BREED_TYPES[species].from_json(info)
+
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', 10))
+SEARCH_MIN_SCORE = float(os.getenv('SEARCH_MIN_SCORE', 0.3))
+ORIGIN_WEIGHT = 0.6
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class BreedSearchIndex:
+    def __init__(self):
+        self.entries = []
+        self.slots = {}
+        self.grams = []
+        self.tokens = []
+        self.name_postings = {}
+        self.origin_postings = {}
+        self.prefixes = []
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, species, breed):
+        self.add_row(species, (breed,), 0)
+
+    def add_row(self, species, breeds, row):
+        # entries point at a row of the breed list, so shared snapshot records are decoded only for results
+        breed = breeds[row]
+        key = (species, normalize_name(breed.name))
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = len(self.entries)
+            self.slots[key] = slot
+            self.entries.append((species, breeds, row))
+            self.grams.append(None)
+            self.tokens.append(None)
+        else:
+            _, old_breeds, old_row = self.entries[slot]
+            old = old_breeds[old_row]
+            self.entries[slot] = (species, breeds, row)
+            if old.name == breed.name and getattr(old, 'origin', None) == getattr(breed, 'origin', None):
+                return
+            self.unindex(slot)
+        self.index(slot, breed)
+
+    def index(self, slot, breed):
+        name = normalize_name(breed.name)
+        origin = normalize_name(getattr(breed, 'origin', None) or '')
+        name_grams = trigrams(name)
+        origin_grams = trigrams(origin) if origin else set()
+        for gram in name_grams:
+            self.name_postings.setdefault(gram, set()).add(slot)
+        for gram in origin_grams:
+            self.origin_postings.setdefault(gram, set()).add(slot)
+        tokens = {(token, slot, 1.0) for token in name.split()} | {(name, slot, 1.0)}
+        tokens |= {(token, slot, ORIGIN_WEIGHT) for token in origin.split()}
+        for token in tokens:
+            bisect.insort(self.prefixes, token)
+        self.grams[slot] = (name_grams, origin_grams)
+        self.tokens[slot] = tokens
+
+    def unindex(self, slot):
+        name_grams, origin_grams = self.grams[slot]
+        for gram in name_grams:
+            self.name_postings[gram].discard(slot)
+        for gram in origin_grams:
+            self.origin_postings[gram].discard(slot)
+        for token in self.tokens[slot]:
+            i = bisect.bisect_left(self.prefixes, token)
+            if i < len(self.prefixes) and self.prefixes[i] == token:
+                del self.prefixes[i]
+
+    def retain(self, names):
+        for key, slot in list(self.slots.items()):
+            species, name = key
+            if name not in names.get(species, ()):
+                self.unindex(slot)
+                del self.slots[key]
+                self.entries[slot] = self.grams[slot] = self.tokens[slot] = None
+
+    def search(self, query, species=None, limit=SEARCH_LIMIT):
+        query = normalize_name(query)
+        if not query:
+            return []
+        scores = {}
+        i = bisect.bisect_left(self.prefixes, (query,))
+        while i < len(self.prefixes) and self.prefixes[i][0].startswith(query):
+            token, slot, weight = self.prefixes[i]
+            score = weight * (1.0 if token == query else 0.9)
+            if score > scores.get(slot, 0):
+                scores[slot] = score
+            i += 1
+
+        query_grams = trigrams(query)
+        for postings, field, weight in ((self.name_postings, 0, 1.0), (self.origin_postings, 1, ORIGIN_WEIGHT)):
+            shared = {}
+            for gram in query_grams:
+                for slot in postings.get(gram, ()):
+                    shared[slot] = shared.get(slot, 0) + 1
+            for slot, count in shared.items():
+                score = weight * 2 * count / (len(query_grams) + len(self.grams[slot][field]))
+                if score > scores.get(slot, 0):
+                    scores[slot] = score
+
+        candidates = [(score, slot) for slot, score in scores.items()
+                      if score >= SEARCH_MIN_SCORE and (species is None or self.entries[slot][0] == species)]
+        top = heapq.nlargest(limit, candidates, key=lambda candidate: (candidate[0], -candidate[1]))
+        results = []
+        for score, slot in top:
+            breed_species, breeds, row = self.entries[slot]
+            results.append((score, breed_species, breeds[row]))
+        return results
+
+breed_search = BreedSearchIndex()
+
+def catalog_put(species, breed, fetched_at=None):
+    breed_search.add(species, breed)
+    breed_catalog[species][normalize_name(breed.name)] = (breed, fetched_at or time.time())
+
+def catalog_get(species, name, allow_stale=False):
+    entry = breed_catalog[species].get(normalize_name(name))
+    if entry is None:
+        return None
+    breed, fetched_at = entry
+    if not allow_stale and time.time() - fetched_at > CATALOG_TTL:
+        return None
+    return breed
+
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'CatAndDogAPI'))
+OFFLINE = os.getenv('OFFLINE', '0') == '1'
+CATALOG_FILE = os.getenv('CATALOG_FILE')
+
+class BreedCache:
+    def __init__(self, directory=CACHE_DIR, ttl=CATALOG_TTL):
+        os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.db = sqlite3.connect(os.path.join(directory, 'breeds.sqlite3'))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS breeds (
+                species TEXT NOT NULL,
+                name TEXT NOT NULL,
+                position INTEGER,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (species, name)
+            );
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def load_breeds(self, species, allow_stale=False):
+        rows = self.db.execute(
+            'SELECT data, fetched_at FROM breeds WHERE species = ? ORDER BY position IS NULL, position',
+            (species,)
+        ).fetchall()
+        if not rows:
+            return None
+        if not allow_stale and time.time() - min(fetched_at for _, fetched_at in rows) > self.ttl:
+            return None
+        return [(parse_breed(species, json.loads(data)), fetched_at) for data, fetched_at in rows]
+
+    def save_breeds(self, species, breeds):
+        now = time.time()
+        with self.db:
+            self.db.execute('DELETE FROM breeds WHERE species = ?', (species,))
+            self.db.executemany(
+                'INSERT OR REPLACE INTO breeds (species, name, position, data, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                [(species, normalize_name(breed.name), position, json.dumps(asdict(breed)), now)
+                 for position, breed in enumerate(breeds)]
+            )
+
+    def put_breed(self, species, breed):
+        with self.db:
+            self.db.execute(
+                'INSERT INTO breeds (species, name, data, fetched_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (species, name) DO UPDATE SET data = excluded.data, fetched_at = excluded.fetched_at',
+                (species, normalize_name(breed.name), json.dumps(asdict(breed)), time.time())
+            )
+
+    def get_response(self, url):
+        return self.db.execute(
+            'SELECT etag, last_modified, body FROM responses WHERE url = ?', (url,)
+        ).fetchone()
+
+    def put_response(self, url, etag, last_modified, body):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses (url, etag, last_modified, body, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                (url, etag, last_modified, body, time.time())
+            )
+
+    def touch_response(self, url):
+        with self.db:
+            self.db.execute('UPDATE responses SET fetched_at = ? WHERE url = ?', (time.time(), url))
+
+breed_cache = None
+
+def open_breed_cache():
+    global breed_cache
+    try:
+        breed_cache = BreedCache()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Кэш пород недоступен: {str(e)}")
+        breed_cache = None
+    return breed_cache
+
+def close_breed_cache():
+    global breed_cache
+    if breed_cache is not None:
+        breed_cache.close()
+        breed_cache = None
+
+def load_cached_catalog(allow_stale=False):
+    if breed_cache is None:
+        return None, None
+    result = []
+    for species in ('cat', 'dog'):
+        rows = breed_cache.load_breeds(species, allow_stale=allow_stale)
+        if not rows:
+            return None, None
+        for breed, fetched_at in rows:
+            catalog_put(species, breed, fetched_at=fetched_at)
+        result.append([breed for breed, _ in rows])
+    return tuple(result)
+
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(CACHE_DIR, 'images'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 4))
+IMAGE_TIMEOUT = float(os.getenv('IMAGE_TIMEOUT', 15))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_PREFETCH = os.getenv('IMAGE_PREFETCH', '0') == '1'
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 256))
+
+def write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def make_thumbnail(source, target, size):
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        image.save(tmp_path, 'JPEG', quality=85, optimize=True)
+    os.replace(tmp_path, target)
+    return target
+
+class ImageCache:
+    def __init__(self, directory=IMAGE_CACHE_DIR, workers=IMAGE_WORKERS, thumbnail_size=THUMBNAIL_SIZE):
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+        for subdirectory in ('objects', 'refs', 'thumbs'):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self.downloads = asyncio.Semaphore(workers)
+        self.inflight = {}
+        self.session = None
+
+    def ref_path(self, url):
+        return os.path.join(self.directory, 'refs', hashlib.sha256(url.encode()).hexdigest())
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.directory, 'thumbs', f'{digest}-{self.thumbnail_size}.jpg')
+
+    def read_ref(self, url):
+        try:
+            with open(self.ref_path(url), encoding='utf-8') as f:
+                digest, content_type = f.read().split('\n', 1)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(self.object_path(digest)):
+            return None
+        return digest, content_type
+
+    def store(self, url, data, content_type):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+        write_atomic(self.ref_path(url), f'{digest}\n{content_type}'.encode())
+        return digest, content_type
+
+    def ensure_thumbnail(self, digest):
+        path = self.thumbnail_path(digest)
+        if os.path.exists(path):
+            return path
+        return make_thumbnail(self.object_path(digest), path, self.thumbnail_size)
+
+    async def download(self, url):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=IMAGE_TIMEOUT))
+        async with self.downloads:
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ValueError(f"Картинка больше {IMAGE_MAX_BYTES} байт: {url}")
+                    chunks.append(chunk)
+                return b''.join(chunks), response.content_type
+
+    @metrics.timed('image')
+    async def fetch(self, url, thumbnail=True):
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(self.executor, self.read_ref, url)
+        if entry is None:
+            metrics.inc('image_cache', result='miss')
+            if OFFLINE:
+                return None
+            data, content_type = await self.download(url)
+            entry = await loop.run_in_executor(self.executor, self.store, url, data, content_type)
+        else:
+            metrics.inc('image_cache', result='hit')
+        digest, content_type = entry
+        if thumbnail and Image is not None:
+            try:
+                return await loop.run_in_executor(self.executor, self.ensure_thumbnail, digest), 'image/jpeg'
+            except Exception:
+                metrics.inc('image_thumbnail_errors')
+        return self.object_path(digest), content_type
+
+    def start(self, url, thumbnail=True):
+        key = (url, thumbnail)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.fetch(url, thumbnail))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.finish(key, done))
+        return task
+
+    async def get(self, url, thumbnail=True):
+        return await asyncio.shield(self.start(url, thumbnail))
+
+    def cached(self, url, thumbnail=True):
+        entry = self.read_ref(url)
+        if entry is None:
+            return None
+        digest, _ = entry
+        if thumbnail and Image is not None:
+            path = self.thumbnail_path(digest)
+            return path if os.path.exists(path) else None
+        return self.object_path(digest)
+
+    def finish(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def prefetch(self, urls, thumbnail=True):
+        urls = list(dict.fromkeys(url for url in urls if url))
+        results = await asyncio.gather(*(self.get(url, thumbnail) for url in urls), return_exceptions=True)
+        return sum(1 for result in results if result is not None and not isinstance(result, BaseException))
+
+    async def close(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+        if self.session is not None:
+            await self.session.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+image_cache = None
+
+def open_image_cache():
+    global image_cache
+    try:
+        image_cache = ImageCache()
+    except OSError as e:
+        print(f"Кэш картинок недоступен: {str(e)}")
+        image_cache = None
+    return image_cache
+
+async def close_image_cache():
+    global image_cache
+    if image_cache is not None:
+        await image_cache.close()
+        image_cache = None
+
+def breed_image(breed_info, thumbnail=True):
+    # never waits on the network: a miss is fetched in the background and shows up on a later view
+    if image_cache is None or not breed_info.image_link:
+        return None
+    path = image_cache.cached(breed_info.image_link, thumbnail)
+    if path is None:
+        image_cache.start(breed_info.image_link, thumbnail)
+    return path
+
+async def prefetch_breed_images(breeds):
+    if image_cache is None:
+        return 0
+    return await image_cache.prefetch(breed.image_link for breed in breeds)
+
+API_RATE_LIMIT = float(os.getenv('API_RATE_LIMIT', 10))
+API_RATE_BURST = int(os.getenv('API_RATE_BURST', 10))
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 4))
+API_BACKOFF_BASE = float(os.getenv('API_BACKOFF_BASE', 0.5))
+API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', 30))
+API_REQUEST_TIMEOUT = float(os.getenv('API_REQUEST_TIMEOUT', 10))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class ApiError(Exception):
+    pass
+
+class CircuitOpenError(ApiError):
+    pass
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # tokens may go negative: each caller reserves the next free slot and sleeps until it is due
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def pause(self, delay):
+        self._refill()
+        self.tokens = min(self.tokens, 0) - delay * self.rate
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        # half-open: one probe per reset timeout, its outcome closes or reopens the breaker;
+        # a probe that never reports back (429, cancellation) just lets the next one through later
+        self.opened_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    def __init__(self, rate=API_RATE_LIMIT, burst=API_RATE_BURST, max_retries=API_MAX_RETRIES,
+                 backoff_base=API_BACKOFF_BASE, backoff_max=API_BACKOFF_MAX, timeout=API_REQUEST_TIMEOUT):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def request(self, session, url, handle, params=None, headers=None):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                metrics.inc('circuit_open_rejections')
+                raise CircuitOpenError(f"API недоступен, повтор через {CIRCUIT_RESET_TIMEOUT:g} с")
+
+            await self.bucket.acquire()
+            retry_after = None
+            metrics.gauge('upstream_inflight', 1)
+            start = time.perf_counter()
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=self.timeout) as response:
+                    metrics.inc('upstream_responses', status=response.status)
+                    if response.status not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        return await handle(response)
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    error = ApiError(f"{response.status} - {await response.text()}")
+                    if response.status == 429:
+                        self.bucket.pause(retry_after if retry_after is not None else self.backoff(attempt))
+                    else:
+                        self.breaker.record_failure()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                self.breaker.record_failure()
+                metrics.inc('upstream_errors', error=type(e).__name__)
+            finally:
+                metrics.gauge('upstream_inflight', -1)
+                metrics.observe('stage_seconds', time.perf_counter() - start, stage='upstream')
+
+            if attempt >= self.max_retries:
+                raise error
+            metrics.inc('upstream_retries')
+            await asyncio.sleep(self.backoff(attempt, retry_after))
+            attempt += 1
+
+scheduler = RequestScheduler()
+
+def cached_response(url, params):
+    key = f'{url}?{urlencode(sorted(params.items()))}'
+    cached = breed_cache.get_response(key) if breed_cache is not None else None
+    headers = {}
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return key, cached, headers
+
+async def get_json_cached(session, url, params):
+    key, cached, headers = cached_response(url, params)
+
+    async def handle(response):
+        if response.status == 304 and cached is not None:
+            metrics.inc('http_cache', result='revalidated')
+            breed_cache.touch_response(key)
+            return json.loads(cached[2]), None, None
+        if response.status != 200:
+            error = await response.text()
+            raise ApiError(f"{response.status} - {error}")
+        metrics.inc('http_cache', result='miss' if cached is None else 'changed')
+        return await response.json(), response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    data, etag, last_modified = await scheduler.request(session, url, handle, params=params, headers=headers)
+
+    if breed_cache is not None and (etag or last_modified):
+        breed_cache.put_response(key, etag, last_modified, json.dumps(data))
+    return data
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 16 * 1024))
+JSON_SEPARATORS = ' \t\r\n,'
+
+async def iter_json_array(content, key=None, chunk_size=STREAM_CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    chunks = content.iter_chunked(chunk_size)
+    async for chunk in chunks:
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] == '{':
+                    rest = [buffer[position:]]
+                    async for chunk in chunks:
+                        rest.append(text_decoder.decode(chunk))
+                    rest.append(text_decoder.decode(b'', final=True))
+                    for item in json.loads(''.join(rest)).get(key, []):
+                        yield item
+                    return
+                if buffer[position] != '[':
+                    raise ValueError(f"Ожидался JSON-массив, получено: {buffer[position:position + 20]!r}")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if end == len(buffer):
+                break
+            position = end
+            yield item
+    raise ValueError("Ответ API оборван: JSON-массив не закрыт")
+
+def breed_records(species, data):
+    return data if isinstance(data, list) else data.get(species + 's', [])
+
+async def stream_breeds_cached(session, species, url, params, publish=True):
+    key, cached, headers = cached_response(url, params)
+
+    def ingest(info):
+        breed = parse_breed(species, info)
+        if publish:
+            catalog_put(species, breed)
+        return breed
+
+    async def handle(response):
+        if response.status == 304 and cached is not None:
+            metrics.inc('http_cache', result='revalidated')
+            breed_cache.touch_response(key)
+            return [ingest(info) for info in breed_records(species, json.loads(cached[2]))], None, None
+        if response.status != 200:
+            error = await response.text()
+            raise ApiError(f"{response.status} - {error}")
+        metrics.inc('http_cache', result='miss' if cached is None else 'changed')
+        breeds = [ingest(info) async for info in iter_json_array(response.content, species + 's')]
+        return breeds, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    breeds, etag, last_modified = await scheduler.request(session, url, handle, params=params, headers=headers)
+
+    if breed_cache is not None and (etag or last_modified):
+        breed_cache.put_response(key, etag, last_modified, json.dumps([asdict(breed) for breed in breeds]))
+    return breeds
+
+async def fetch_breed_record(session, species, name):
+    api_url = api_url_cats if species == 'cat' else api_url_dogs
+    data = await get_json_cached(session, api_url, {'name': name})
+    if not isinstance(data, list):
+        return None
+    # upstream matches names partially, so only an exact hit counts as this breed
+    key = normalize_name(name)
+    for info in data:
+        if isinstance(info, dict) and normalize_name(str(info.get('name', ''))) == key:
+            breed = parse_breed(species, info)
+            catalog_put(species, breed)
+            if breed_cache is not None:
+                breed_cache.put_breed(species, breed)
+            return breed
+    return None
+
+inflight_lookups = {}
+metrics.gauge_callback('lookups_inflight', lambda: len(inflight_lookups))
+
+def _finish_lookup(key, task):
+    if inflight_lookups.get(key) is task:
+        del inflight_lookups[key]
+    if not task.cancelled():
+        task.exception()
+
+async def lookup_breed(session, species, name):
+    key = (species, normalize_name(name))
+    task = inflight_lookups.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch_breed_record(session, species, name))
+        inflight_lookups[key] = task
+        task.add_done_callback(lambda done: _finish_lookup(key, done))
+    return await asyncio.shield(task)
+
+async def get_breed_record(session, species, name):
+    breed = catalog_get(species, name)
+    if breed is not None:
+        metrics.inc('catalog_lookups', result='hit')
+        return breed
+    metrics.inc('catalog_lookups', result='miss')
+
+    try:
+        if not OFFLINE:
+            breed = await lookup_breed(session, species, name)
+            if breed is not None:
+                return breed
+    except ApiError:
+        pass
     except Exception as e:
         print(f"Request failed: {str(e)}")
-        return (breed['name'],) + ('N/A',) * 10
 
+    breed = catalog_get(species, name, allow_stale=True)
+    if breed is not None:
+        metrics.inc('catalog_lookups', result='stale')
+        return breed
+    metrics.inc('catalog_lookups', result='placeholder')
+    return BREED_TYPES[species](name=name)
+
+@metrics.timed('get_breeds_cats_inf')
+async def get_breeds_cats_inf(session, breed):
+    return await get_breed_record(session, 'cat', breed.name)
+
+@metrics.timed('get_breeds_dogs_inf')
 async def get_breeds_dogs_inf(session, breed):
-    headers = {
-        'X-Api-Key': X_API_KEY,
-        'User-Agent': 'Chrome/91.0.4472.124',
-        'Accept': 'application/json'
-    }
-    params = {'name': breed['name']}
-    try:
-        async with session.get(api_url_dogs, headers=headers, params=params) as response:
-            if response.status == 200:
-                json = await response.json()
-                if json and isinstance(json, list) and len(json) > 0:
-                    info = json[0]
-                    return (
-                        breed['name'],
-                        info.get('image_link', 'N/A'),
-                        info.get('min_height_male', 'N/A'),
-                        info.get('max_height_male', 'N/A'),
-                        info.get('min_weight_male', 'N/A'),
-                        info.get('max_weight_male', 'N/A'),
-                        info.get('min_height_female', 'N/A'),
-                        info.get('max_height_female', 'N/A'),
-                        info.get('min_weight_female', 'N/A'),
-                        info.get('max_weight_female', 'N/A'),
-                        info.get('min_life_expectancy', 'N/A'),
-                        info.get('max_life_expectancy', 'N/A'),
-                        info.get('shedding', 'N/A'),
-                        info.get('barking', 'N/A'),
-                        info.get('energy', 'N/A'),
-                        info.get('protectiveness', 'N/A'),
-                        info.get('trainability', 'N/A'),
-                        info.get('good_with_children', 'N/A'),
-                        info.get('good_with_other_dogs', 'N/A'),
-                        info.get('good_with_strangers', 'N/A'),
-                        info.get('grooming', 'N/A'),
-                        info.get('drooling', 'N/A'),
-                        info.get('coat_length', 'N/A'),
-                        info.get('playfulness', 'N/A')
-                    )
-            return (breed['name'],) + ('N/A',) * 10
-    except Exception as e:
-        print(f"Request failed: {str(e)}")
-        return (breed['name'],) + ('N/A',) * 10
+    return await get_breed_record(session, 'dog', breed.name)
+
+@metrics.timed('get_breeds_async')
+async def get_breeds_async(session, breeds, is_cat=True):
+    tasks = []
+    for breed in breeds:
+        if is_cat:
+            tasks.append(get_breeds_cats_inf(session, breed))
+        else:
+            tasks.append(get_breeds_dogs_inf(session, breed))
+    return await asyncio.gather(*tasks)
 
-async def get_breeds_async(breeds, is_cat=True):
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for breed in breeds:
-            if is_cat:
-                tasks.append(get_breeds_cats_inf(session, breed))
-            else:
-                tasks.append(get_breeds_dogs_inf(session, breed))
-        return await asyncio.gather(*tasks)
-
-async def fetch_breeds():
-    try:
-        async with aiohttp.ClientSession() as session:
-            params = {'min_life_expectancy': 1}
-            headers = {
-                'X-Api-Key': X_API_KEY,
-                'User-Agent': 'Chrome/91.0.4472.124',
-                'Accept': 'application/json'
-            }
-            async with session.get(
-                    api_url_cats,
-                    headers=headers,
-                    params=params
-            ) as resp_cats:
-                if resp_cats.status != 200:
-                    error = await resp_cats.text()
-                    print(f"Cat API Error: {resp_cats.status} - {error}")
-                    return None, None
-                cats_data = await resp_cats.json()
-
-            async with session.get(
-                    api_url_dogs,
-                    headers=headers,
-                    params=params
-            ) as resp_dogs:
-                if resp_dogs.status != 200:
-                    error = await resp_dogs.text()
-                    print(f"Dog API Error: {resp_dogs.status} - {error}")
-                    return None, None
-                dogs_data = await resp_dogs.json()
-
-            breeds_cats = cats_data if isinstance(cats_data, list) else cats_data.get('cats', [])
-            breeds_dogs = dogs_data if isinstance(dogs_data, list) else dogs_data.get('dogs', [])
-
-            print(f"Найдено {len(breeds_cats)} кошек и {len(breeds_dogs)} собак")
-
-            if not breeds_cats or not breeds_dogs:
-                print("Пустые данные. Проверьте параметры запроса.")
-                return None, None
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', 8))
+
+async def iter_breeds_info(session, breeds, is_cat=True, workers=FETCH_WORKERS):
+    semaphore = asyncio.Semaphore(workers)
+
+    async def fetch_one(breed):
+        async with semaphore:
+            results = await get_breeds_async(session, [breed], is_cat=is_cat)
+            return breed, results[0]
 
+    tasks = [asyncio.create_task(fetch_one(breed)) for breed in breeds]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+
+CAT_TRAITS = ('shedding', 'family_friendly', 'playfulness', 'grooming',
+              'other_pets_friendly', 'children_friendly', 'intelligence', 'general_health')
+DOG_TRAITS = ('shedding', 'barking', 'energy', 'protectiveness', 'trainability', 'good_with_children',
+              'good_with_other_dogs', 'good_with_strangers', 'grooming', 'drooling', 'coat_length', 'playfulness')
+SPECIES_TRAITS = {'cat': CAT_TRAITS, 'dog': DOG_TRAITS}
+
+CAT_RULES = (('shedding', '<=', 1.0), ('family_friendly', '>=', 1.0), ('playfulness', '>=', 1.0),
+             ('grooming', '<=', 1.0), ('general_health', '>=', 1.0))
+DOG_RULES = (('shedding', '<=', 1.0), ('barking', '<=', 1.0), ('energy', '<=', 1.0), ('protectiveness', '>=', 1.0),
+             ('trainability', '>=', 1.0), ('good_with_strangers', '>=', 1.0), ('grooming', '<=', 1.0))
+MATCH_RULES = {'cat': CAT_RULES, 'dog': DOG_RULES}
+
+MATCH_TOP_K = int(os.getenv('MATCH_TOP_K', 10))
+MISSING_PENALTY = 2.0
+SURPLUS_WEIGHT = 0.1
+
+class TraitIndex:
+    __slots__ = ('species', 'breeds', 'columns', 'missing', 'rule_signs', 'rule_weights',
+                 'rule_matrix', 'rule_vectors', 'rule_missing')
+
+    def __init__(self, species, breeds, arrays=None):
+        rules = MATCH_RULES[species]
+        self.species = species
+        self.breeds = breeds
+        self.rule_signs = np.array([-1 if op == '<=' else 1 for _, op, _ in rules], dtype=np.int8)
+        self.rule_weights = np.array([weight for _, _, weight in rules], dtype=np.float32)
+        if arrays is None:
+            arrays = self.build_arrays(species, breeds)
+        self.columns = {trait: arrays['column:' + trait] for trait in SPECIES_TRAITS[species]}
+        self.missing = {trait: arrays['missing:' + trait] for trait in SPECIES_TRAITS[species]}
+        self.rule_matrix = arrays['rule_matrix']
+        self.rule_vectors = arrays['rule_vectors']
+        self.rule_missing = arrays['rule_missing']
+
+    @staticmethod
+    def build_arrays(species, breeds):
+        arrays = {}
+        count = len(breeds)
+        for trait in SPECIES_TRAITS[species]:
+            values = [getattr(breed, trait) for breed in breeds]
+            arrays['missing:' + trait] = np.fromiter((value is None for value in values), dtype=bool, count=count)
+            arrays['column:' + trait] = np.fromiter((value or 0 for value in values), dtype=np.int8, count=count)
+
+        # '<=' rules are stored negated so every rule becomes column >= threshold
+        rules = MATCH_RULES[species]
+        rule_matrix = np.empty((count, len(rules)), dtype=np.int8)
+        rule_missing = np.empty((count, len(rules)), dtype=bool)
+        for k, (trait, op, _) in enumerate(rules):
+            rule_matrix[:, k] = arrays['column:' + trait] * (-1 if op == '<=' else 1)
+            rule_missing[:, k] = arrays['missing:' + trait]
+        arrays['rule_matrix'] = rule_matrix
+        arrays['rule_vectors'] = rule_matrix.astype(np.float32)
+        arrays['rule_missing'] = rule_missing
+        return arrays
+
+    def arrays(self):
+        arrays = {'rule_matrix': self.rule_matrix, 'rule_vectors': self.rule_vectors, 'rule_missing': self.rule_missing}
+        for trait in SPECIES_TRAITS[self.species]:
+            arrays['column:' + trait] = self.columns[trait]
+            arrays['missing:' + trait] = self.missing[trait]
+        return arrays
+
+    def __len__(self):
+        return len(self.breeds)
+
+    def thresholds(self, client_answers):
+        return np.array([client_answers[trait] for trait, _, _ in MATCH_RULES[self.species]],
+                        dtype=np.int8) * self.rule_signs
+
+    def distances(self, client_answers):
+        diff = self.rule_vectors - self.thresholds(client_answers)
+        penalty = np.maximum(-diff, 0) + SURPLUS_WEIGHT * np.maximum(diff, 0)
+        penalty[self.rule_missing] = MISSING_PENALTY
+        return penalty @ self.rule_weights
+
+    @metrics.timed('match_rank')
+    def rank(self, client_answers, k=MATCH_TOP_K):
+        distances = self.distances(client_answers)
+        if k < len(distances):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return [(float(distances[i]), self.breeds[i]) for i in top]
+
+    def rank_many(self, thresholds, k=MATCH_TOP_K):
+        diff = self.rule_vectors[None, :, :] - thresholds[:, None, :].astype(np.float32)
+        penalty = np.maximum(-diff, 0) + SURPLUS_WEIGHT * np.maximum(diff, 0)
+        penalty[:, self.rule_missing] = MISSING_PENALTY
+        distances = penalty @ self.rule_weights
+        k = min(k, distances.shape[1])
+        if k < distances.shape[1]:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+        matches = (self.rule_matrix[top] >= thresholds[:, None, :]).all(axis=2)
+        return top, top_distances, matches
+
+trait_indexes = {}
+
+def get_trait_index(species, breeds):
+    index = trait_indexes.get(species)
+    if index is None or index.breeds is not breeds or len(index) != len(breeds):
+        index = TraitIndex(species, breeds)
+        trait_indexes[species] = index
+    return index
+
+def breed_distance(species, client_answers, breed_info):
+    distance = 0.0
+    for trait, op, weight in MATCH_RULES[species]:
+        value = getattr(breed_info, trait)
+        if value is None:
+            distance += weight * MISSING_PENALTY
+            continue
+        diff = value - client_answers[trait] if op == '>=' else client_answers[trait] - value
+        distance += weight * (-diff if diff < 0 else SURPLUS_WEIGHT * diff)
+    return distance
+
+def validate_answers(species, answers):
+    client_answers = {}
+    for trait, _, _ in MATCH_RULES[species]:
+        if trait not in answers:
+            raise ValueError(f"Не указан параметр {trait}")
+        try:
+            value = int(answers[trait])
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Параметр {trait} должен быть числом")
+        if not 1 <= value <= 5:
+            raise ValueError(f"Параметр {trait} должен быть от 1 до 5")
+        client_answers[trait] = value
+    return client_answers
+
+def max_match_distance(species):
+    return sum(weight for _, _, weight in MATCH_RULES[species]) * 4 * (1 + SURPLUS_WEIGHT)
+
+def match_percent(species, distance):
+    return max(0, round(100 * (1 - distance / max_match_distance(species))))
+
+@metrics.timed('match_collect')
+async def collect_matches(session, species, breeds, client_answers, ranked_breeds, first_match, k):
+    try:
+        async for breed, breed_info in iter_breeds_info(session, breeds, species == 'cat'):
+            bisect.insort(ranked_breeds, (breed_distance(species, client_answers, breed_info), breed_info),
+                          key=lambda entry: entry[0])
+            del ranked_breeds[k:]
+            first_match.set()
+    finally:
+        first_match.set()
+
+@metrics.timed('match_start')
+async def start_matching(session, species, breeds, client_answers, k=MATCH_TOP_K):
+    missing = [breed for breed in breeds if catalog_get(species, breed.name) is None]
+    missing_names = {breed.name for breed in missing}
+    ranked_breeds = get_trait_index(species, breeds).rank(client_answers, k + len(missing))
+    if missing_names:
+        ranked_breeds = [entry for entry in ranked_breeds if entry[1].name not in missing_names]
+    del ranked_breeds[k:]
+
+    first_match = asyncio.Event()
+    if ranked_breeds:
+        first_match.set()
+    matching = asyncio.create_task(
+        collect_matches(session, species, missing, client_answers, ranked_breeds, first_match, k))
+    await first_match.wait()
+    return ranked_breeds, matching
+
+CRAWL_PAGE_SIZE = int(os.getenv('CRAWL_PAGE_SIZE', 20))
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 4))
+CRAWL_TIME_BUDGET = float(os.getenv('CRAWL_TIME_BUDGET', 30))
+
+@metrics.timed('fetch_breeds_page')
+async def fetch_breeds_page(session, species, offset, publish=True):
+    api_url = api_url_cats if species == 'cat' else api_url_dogs
+    params = {'min_life_expectancy': 1, 'offset': offset}
+    return await stream_breeds_cached(session, species, api_url, params, publish)
+
+async def crawl_breeds(session, species, deadline, concurrency=CRAWL_CONCURRENCY, publish=True):
+    loop = asyncio.get_running_loop()
+    pages = {}
+    offset = 0
+    end = None
+    complete = True
+
+    while end is None and complete:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            print(f"Время загрузки истекло, {species}: загружено {len(pages)} стр.")
+            complete = False
+            break
+
+        tasks = {asyncio.create_task(fetch_breeds_page(session, species, offset + k * CRAWL_PAGE_SIZE, publish)):
+                 offset + k * CRAWL_PAGE_SIZE for k in range(concurrency)}
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        missing = [tasks[task] for task in pending]
+
+        first_page_error = None
+        for task in done:
+            page_offset = tasks[task]
+            try:
+                records = task.result()
+            except Exception as e:
+                if page_offset == 0:
+                    first_page_error = e
+                else:
+                    print(f"Ошибка загрузки страницы {species} (offset={page_offset}): {str(e)}")
+                missing.append(page_offset)
+                continue
+            pages[page_offset] = records
+            if len(records) < CRAWL_PAGE_SIZE and (end is None or page_offset < end):
+                end = page_offset
+        if first_page_error is not None:
+            raise first_page_error
+
+        # pages past the first short one are empty anyway, only gaps before it make the crawl partial
+        if missing and (end is None or min(missing) < end):
+            if pending:
+                print(f"Время загрузки истекло, {species}: загружено {len(pages)} стр.")
+            complete = False
+
+        offset += concurrency * CRAWL_PAGE_SIZE
+
+    breeds = []
+    seen = set()
+    for page_offset in sorted(pages):
+        for breed in pages[page_offset]:
+            key = normalize_name(breed.name)
+            if key not in seen:
+                seen.add(key)
+                breeds.append(breed)
+    return breeds, complete
+
+async def crawl_catalog(session, time_budget=CRAWL_TIME_BUDGET, publish=True):
+    deadline = asyncio.get_running_loop().time() + time_budget
+    crawls = [asyncio.create_task(crawl_breeds(session, species, deadline, publish=publish))
+              for species in ('cat', 'dog')]
+    try:
+        (breeds_cats, cats_complete), (breeds_dogs, dogs_complete) = await asyncio.gather(*crawls)
+    finally:
+        for crawl in crawls:
+            crawl.cancel()
+
+    complete = cats_complete and dogs_complete
+    if complete and breeds_cats and breeds_dogs and breed_cache is not None:
+        breed_cache.save_breeds('cat', breeds_cats)
+        breed_cache.save_breeds('dog', breeds_dogs)
+    return breeds_cats, breeds_dogs, complete
+
+@metrics.timed('fetch_breeds')
+async def fetch_breeds(session, time_budget=CRAWL_TIME_BUDGET):
+    breeds_cats, breeds_dogs = load_cached_catalog()
+    if breeds_cats is not None:
+        print(f"Загружено из кэша: {len(breeds_cats)} кошек и {len(breeds_dogs)} собак")
+        return breeds_cats, breeds_dogs
+
+    if OFFLINE:
+        return fetch_breeds_offline()
+
+    try:
+        breeds_cats, breeds_dogs, complete = await crawl_catalog(session, time_budget)
+        if not breeds_cats or not breeds_dogs:
+            print("Пустые данные. Проверьте параметры запроса.")
+            return fetch_breeds_offline()
+
+        if not complete:
+            print(f"Каталог загружен не полностью ({len(breeds_cats)} кошек и {len(breeds_dogs)} собак), в кэш не сохранён")
+            cached_cats, cached_dogs = fetch_breeds_offline()
+            if cached_cats is not None:
+                return cached_cats, cached_dogs
             return breeds_cats, breeds_dogs
 
+        print(f"Найдено {len(breeds_cats)} кошек и {len(breeds_dogs)} собак")
+        return breeds_cats, breeds_dogs
+
+    except ApiError as e:
+        print(f"API Error: {str(e)}")
+        return fetch_breeds_offline()
     except Exception as e:
         print(f"Ошибка соединения: {str(e)}")
-        return None, None
+        return fetch_breeds_offline()
 
-async def show_breeds_pages(combined_breeds):
+def fetch_breeds_offline():
+    breeds_cats, breeds_dogs = load_cached_catalog(allow_stale=True)
+    if breeds_cats is not None:
+        print(f"Офлайн-режим: из кэша загружено {len(breeds_cats)} кошек и {len(breeds_dogs)} собак")
+    return breeds_cats, breeds_dogs
+
+catalog_files = []
+
+def load_catalog_file(path):
+    try:
+        mapped, snapshot, _ = import_snapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось загрузить снимок каталога {path}: {str(e)}")
+        return None
+    catalog_files.append(mapped)
+    for species in snapshot.breeds:
+        trait_indexes[species] = snapshot.indexes[species]
+    # a snapshot may be older than CATALOG_TTL, its records count as fresh until the first refresh replaces them
+    publish_catalog(snapshot)
+    print(f"Загружено из снимка {path}: {len(snapshot.breeds['cat'])} кошек и {len(snapshot.breeds['dog'])} собак")
+    return snapshot
+
+def close_catalog_files():
+    trait_indexes.clear()
+    gc.collect()
+    catalog_files[:] = close_shared_memory(catalog_files)
+
+_input_requests = queue.SimpleQueue()
+_input_thread = None
+
+def _resolve_input(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def _read_line(fd, buffer, encoding):
+    while True:
+        end = buffer.find(b'\n')
+        if end >= 0:
+            line = bytes(buffer[:end])
+            del buffer[:end + 1]
+            return line.decode(encoding, errors='replace').rstrip('\r')
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            if not buffer:
+                raise EOFError("EOF when reading a line")
+            buffer.extend(b'\n')
+        buffer.extend(chunk)
+
+def stdin_encoding():
+    # a Windows console hands the raw fd bytes in its input code page, not in sys.stdin.encoding
+    if os.name == 'nt' and sys.stdin.isatty():
+        with contextlib.suppress(LookupError):
+            return codecs.lookup(f'cp{ctypes.windll.kernel32.GetConsoleCP()}').name
+    return sys.stdin.encoding or 'utf-8'
+
+def _input_worker():
+    # reads the raw fd: input() would hold the sys.stdin lock and abort interpreter shutdown on Ctrl+C
+    buffer = bytearray()
+    encoding = stdin_encoding()
+    while True:
+        loop, future = _input_requests.get()
+        try:
+            result, error = _read_line(sys.stdin.fileno(), buffer, encoding), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_resolve_input, future, result, error)
+        except RuntimeError:
+            pass
+
+async def ainput(prompt=''):
+    global _input_thread
+    if _input_thread is None:
+        _input_thread = threading.Thread(target=_input_worker, name='stdin', daemon=True)
+        _input_thread.start()
+    print(prompt, end='', flush=True)
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _input_requests.put((loop, future))
+    return await future
+
+async def warm_breeds(session, species, breeds):
+    missing = [breed for breed in breeds if catalog_get(species, breed.name) is None]
+    async for _ in iter_breeds_info(session, missing, species == 'cat'):
+        pass
+    get_trait_index(species, breeds)
+
+@metrics.timed('render_page')
+def render_breed_page(animal_type, breed_info, thumbnail=None):
+    lines = []
+    lines.append(f"\n--- {'Кошка' if animal_type == 'cat' else 'Собака'} ---")
+    lines.append(f"Порода: {breed_info.name}")
+
+    if animal_type == 'cat':
+        lines.append(f"Ссылка на картинку: {fmt(breed_info.image_link)}")
+        if thumbnail is not None:
+            lines.append(f"Картинка в кэше: {thumbnail}")
+        lines.append(f"Длина: {fmt(breed_info.length)}")
+        lines.append(f"Место происхождения: {fmt(breed_info.origin)}")
+        lines.append(f"Мин. вес: {fmt(breed_info.min_weight)} фунтов")
+        lines.append(f"Макс. вес: {fmt(breed_info.max_weight)} фунтов")
+        lines.append(f"Мин. продолжительность жизни: {fmt(breed_info.min_life_expectancy)} лет")
+        lines.append(f"Макс. продолжительность жизни: {fmt(breed_info.max_life_expectancy)} лет")
+        lines.append(f"Сколько шерсти линяет кошка (от 1 до 5): {fmt(breed_info.shedding)}")
+        lines.append(f"Насколько ласкова кошка к семье (от 1 до 5): {fmt(breed_info.family_friendly)}")
+        lines.append(f"Насколько игрив кот (от 1 до 5): {fmt(breed_info.playfulness)}")
+        lines.append(f"Сколько работы требуется для правильного ухода за кошкой (от 1 до 5): {fmt(breed_info.grooming)}")
+        lines.append(f"Насколько хорошо кошка ладит с другими домашними животными в доме (от 1 до 5): {fmt(breed_info.other_pets_friendly)}")
+        lines.append(f"Насколько хорошо кошка ладит с детьми (от 1 до 5): {fmt(breed_info.children_friendly)}")
+        lines.append(f"Оценка интеллекта (от 1 до 5): {fmt(breed_info.intelligence)}")
+        lines.append(f"Общая оценка здоровья (от 1 до 5): {fmt(breed_info.general_health)}")
+    else:
+        lines.append(f"Ссылка на картинку: {fmt(breed_info.image_link)}")
+        if thumbnail is not None:
+            lines.append(f"Картинка в кэше: {thumbnail}")
+        lines.append("--Пол: male--")
+        lines.append(f"Мин. рост: {fmt(breed_info.min_height_male)} дюймов")
+        lines.append(f"Макс. рост: {fmt(breed_info.max_height_male)} дюймов")
+        lines.append(f"Мин. вес: {fmt(breed_info.min_weight_male)} фунтов")
+        lines.append(f"Макс. вес: {fmt(breed_info.max_weight_male)} фунтов")
+        lines.append("--Пол: female--")
+        lines.append(f"Мин. рост: {fmt(breed_info.min_height_female)} дюймов")
+        lines.append(f"Макс. рост: {fmt(breed_info.max_height_female)} дюймов")
+        lines.append(f"Мин. вес: {fmt(breed_info.min_weight_female)} фунтов")
+        lines.append(f"Макс. вес: {fmt(breed_info.max_weight_female)} фунтов")
+        lines.append(f"Мин. продолжительность жизни: {fmt(breed_info.min_life_expectancy)} лет")
+        lines.append(f"Макс. продолжительность жизни: {fmt(breed_info.max_life_expectancy)} лет")
+        lines.append(f"Сколько шерсти линяет собака (от 1 до 5): {fmt(breed_info.shedding)}")
+        lines.append(f"Склонность к лаю (от 1 до 5): {fmt(breed_info.barking)}")
+        lines.append(f"Энергичность (от 1 до 5): {fmt(breed_info.energy)}")
+        lines.append(f"Защитные качества (от 1 до 5): {fmt(breed_info.protectiveness)}")
+        lines.append(f"Обучаемость (от 1 до 5): {fmt(breed_info.trainability)}")
+        lines.append(f"Насколько хорошо собака ладит с детьми (от 1 до 5): {fmt(breed_info.good_with_children)}")
+        lines.append(f"Насколько хорошо собака ладит с другими собаками (от 1 до 5): {fmt(breed_info.good_with_other_dogs)}")
+        lines.append(f"Насколько хорошо собака ладит с незнакомцами (от 1 до 5): {fmt(breed_info.good_with_strangers)}")
+        lines.append(f"Сколько работы требуется для правильного ухода за собакой (от 1 до 5): {fmt(breed_info.grooming)}")
+        lines.append(f"Насколько сильно проявляется слюнотечение (от 1 до 5): {fmt(breed_info.drooling)}")
+        lines.append(f"Насколько длинная шерсть (от 1 до 5): {fmt(breed_info.coat_length)}")
+        lines.append(f"Насколько игрива собака (от 1 до 5): {fmt(breed_info.playfulness)}")
+    lines.append("-" * 50)
+    return '\n'.join(lines)
+
+PAGER_CACHE_SIZE = int(os.getenv('PAGER_CACHE_SIZE', 32))
+PREFETCH_AHEAD = int(os.getenv('PREFETCH_AHEAD', 3))
+PREFETCH_BEHIND = int(os.getenv('PREFETCH_BEHIND', 1))
+
+class PagePrefetcher:
+    def __init__(self, render_page, last_page, cache_size=PAGER_CACHE_SIZE,
+                 ahead=PREFETCH_AHEAD, behind=PREFETCH_BEHIND):
+        self.render_page = render_page
+        self.last_page = last_page
+        self.cache_size = cache_size
+        self.ahead = ahead
+        self.behind = behind
+        self.pages = OrderedDict()
+        self.tasks = {}
+
+    async def _load(self, page):
+        try:
+            text = await self.render_page(page)
+            self.pages[page] = text
+            self.pages.move_to_end(page)
+            while len(self.pages) > self.cache_size:
+                self.pages.popitem(last=False)
+            return text
+        finally:
+            if self.tasks.get(page) is asyncio.current_task():
+                del self.tasks[page]
+
+    def _start(self, page):
+        task = self.tasks.get(page)
+        if task is None:
+            task = asyncio.create_task(self._load(page))
+            self.tasks[page] = task
+        return task
+
+    async def get(self, page):
+        text = self.pages.get(page)
+        if text is not None:
+            self.pages.move_to_end(page)
+            return text
+        return await self._start(page)
+
+    def prefetch(self, page):
+        wanted = set(range(max(1, page - self.behind), min(self.last_page, page + self.ahead) + 1))
+        for stale_page in [p for p in self.tasks if p not in wanted]:
+            self.tasks.pop(stale_page).cancel()
+        for wanted_page in sorted(wanted, key=lambda p: abs(p - page)):
+            if wanted_page not in self.pages:
+                self._start(wanted_page)
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+async def show_breeds_pages(session, combined_breeds):
     pages = {i + 1: {1: {'type': animal_type, 'breed': breed}}
              for i, (animal_type, breed) in enumerate(combined_breeds)}
     page = 1
     last_page = len(pages)
 
-    while True:
-        os.system('cls')
-        print(f'Страница {page}/{last_page}')
-
+    async def render_page(page):
         current_page_data = pages[page][1]
         animal_type = current_page_data['type']
         breed_data = current_page_data['breed']
 
-        results = await get_breeds_async([breed_data], is_cat=(animal_type == 'cat'))
-        breed_info = results[0]
-
-        print(f"\n--- {'Кошка' if animal_type == 'cat' else 'Собака'} ---")
-        print(f"Порода: {breed_info[0]}")
-
-        if animal_type == 'cat':
-            print(f"Ссылка на картинку: {breed_info[1]}")
-            print(f"Длина: {breed_info[2]}")
-            print(f"Место происхождения: {breed_info[3]}")
-            print(f"Мин. вес: {breed_info[4]} фунтов")
-            print(f"Макс. вес: {breed_info[5]} фунтов")
-            print(f"Мин. продолжительность жизни: {breed_info[6]} лет")
-            print(f"Макс. продолжительность жизни: {breed_info[7]} лет")
-            print(f"Сколько шерсти линяет кошка (от 1 до 5): {breed_info[8]}")
-            print(f"Насколько ласкова кошка к семье (от 1 до 5): {breed_info[9]}")
-            print(f"Насколько игрив кот (от 1 до 5): {breed_info[10]}")
-            print(f"Сколько работы требуется для правильного ухода за кошкой (от 1 до 5): {breed_info[11]}")
-            print(f"Насколько хорошо кошка ладит с другими домашними животными в доме (от 1 до 5): {breed_info[12]}")
-            print(f"Насколько хорошо кошка ладит с детьми (от 1 до 5): {breed_info[13]}")
-            print(f"Оценка интеллекта (от 1 до 5): {breed_info[14]}")
-            print(f"Общая оценка здоровья (от 1 до 5): {breed_info[15]}")
-        else:
-            print(f"Ссылка на картинку: {breed_info[1]}")
-            print("--Пол: male--")
-            print(f"Мин. рост: {breed_info[2]} дюймов")
-            print(f"Макс. рост: {breed_info[3]} дюймов")
-            print(f"Мин. вес: {breed_info[4]} фунтов")
-            print(f"Макс. вес: {breed_info[5]} фунтов")
-            print("--Пол: female--")
-            print(f"Мин. рост: {breed_info[6]} дюймов")
-            print(f"Макс. рост: {breed_info[7]} дюймов")
-            print(f"Мин. вес: {breed_info[8]} фунтов")
-            print(f"Макс. вес: {breed_info[9]} фунтов")
-            print(f"Мин. продолжительность жизни: {breed_info[10]} лет")
-            print(f"Макс. продолжительность жизни: {breed_info[11]} лет")
-            print(f"Сколько шерсти линяет собака (от 1 до 5): {breed_info[12]}")
-            print(f"Склонность к лаю (от 1 до 5): {breed_info[13]}")
-            print(f"Энергичность (от 1 до 5): {breed_info[14]}")
-            print(f"Защитные качества (от 1 до 5): {breed_info[15]}")
-            print(f"Обучаемость (от 1 до 5): {breed_info[16]}")
-            print(f"Насколько хорошо собака ладит с детьми (от 1 до 5): {breed_info[17]}")
-            print(f"Насколько хорошо собака ладит с другими собаками (от 1 до 5): {breed_info[18]}")
-            print(f"Насколько хорошо собака ладит с незнакомцами (от 1 до 5): {breed_info[19]}")
-            print(f"Сколько работы требуется для правильного ухода за собакой (от 1 до 5): {breed_info[20]}")
-            print(f"Насколько сильно проявляется слюнотечение (от 1 до 5): {breed_info[21]}")
-            print(f"Насколько длинная шерсть (от 1 до 5): {breed_info[22]}")
-            print(f"Насколько игрива собака (от 1 до 5): {breed_info[23]}")
+        results = await get_breeds_async(session, [breed_data], is_cat=(animal_type == 'cat'))
+        return render_breed_page(animal_type, results[0], breed_image(results[0]))
 
-        print("-" * 50)
+    prefetcher = PagePrefetcher(render_page, last_page)
+    try:
+        while True:
+            text = await prefetcher.get(page)
+            prefetcher.prefetch(page)
+
+            os.system('cls')
+            print(f'Страница {page}/{last_page}')
+            print(text)
+
+            if page == 1 and last_page > 1:
+                menu = '1-След. порода\n0-Выход\nВведите действие: '
+            elif page == last_page and last_page > 1:
+                menu = '2-Пред. порода\n0-Выход\nВведите действие: '
+            elif last_page == 1:
+                menu = '0-Выход\nВведите действие: '
+            else:
+                menu = '1-След. порода\n2-Пред. порода\n0-Выход\nВведите действие: '
 
-        if page == 1 and last_page > 1:
-            menu = '1-След. порода\n0-Выход\nВведите действие: '
-        elif page == last_page and last_page > 1:
-            menu = '2-Пред. порода\n0-Выход\nВведите действие: '
-        elif last_page == 1:
-            menu = '0-Выход\nВведите действие: '
-        else:
-            menu = '1-След. порода\n2-Пред. порода\n0-Выход\nВведите действие: '
+            choice = (await ainput(menu)).strip()
 
-        choice = input(menu).strip()
+            if choice == '0':
+                break
+            elif choice == '1' and page < last_page:
+                page += 1
+            elif choice == '2' and page > 1:
+                page -= 1
+            else:
+                print('Неверная команда')
+                await ainput('Нажмите Enter чтобы продолжить...')
+    finally:
+        prefetcher.close()
+
+async def search_breeds(session):
+    query = (await ainput("Введите название породы или страну происхождения: ")).strip()
+    if not query:
+        return
+    results = breed_search.search(query)
+    if not results:
+        print("Ничего не найдено")
+        await ainput("Нажмите Enter чтобы продолжить...")
+        return
 
-        if choice == '0':
-            break
-        elif choice == '1' and page < last_page:
-            page += 1
-        elif choice == '2' and page > 1:
-            page -= 1
-        else:
-            print('Неверная команда')
-            input('Нажмите Enter чтобы продолжить...')
+    print(f"\nНайдено пород: {len(results)}")
+    for i, (score, species, breed) in enumerate(results, 1):
+        print(f"{i}. {breed.name} ({'кошка' if species == 'cat' else 'собака'}, совпадение {round(score * 100)}%)")
+    await ainput("Нажмите Enter чтобы открыть найденные породы...")
+    await show_breeds_pages(session, [(species, breed) for _, species, breed in results])
 
-async def pet_selection_test(breeds_cats, breeds_dogs):
+async def pet_selection_test(session, breeds_cats, breeds_dogs):
     os.system('cls')
     print("=== Подбор домашнего животного ===")
     choice = -1
@@ -241,91 +1694,93 @@ async def pet_selection_test(breeds_cats, breeds_dogs):
         print("1 - Кошка/кот")
         print("2 - Собака")
         print("0 - Назад")
-        choice = input("Выбор: ").strip()
+        choice = (await ainput("Выбор: ")).strip()
 
         if choice == '0':
             break
         elif choice == '1':
-            await cat_questions(breeds_cats)
+            await cat_questions(session, breeds_cats)
         elif choice == '2':
-            await dog_questions(breeds_dogs)
+            await dog_questions(session, breeds_dogs)
         else:
             print('Неправильное значение')
-            input('Нажмите Enter чтобы продолжить...')
+            await ainput('Нажмите Enter чтобы продолжить...')
 
-async def cat_questions(breeds_cats):
+async def ask_cat_questions():
     client_answers = {}
     try:
         print("\n-Насколько дружелюбного кота Вы хотели бы? (1-5)")
-        friendly = int(input("Ответ: ").strip())
+        friendly = int((await ainput("Ответ: ")).strip())
         if not 1 <= friendly <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['family_friendly'] = friendly
 
         print("\n-Насколько игривого кота Вы хотели бы? (1-5)")
-        playfulness = int(input("Ответ: ").strip())
+        playfulness = int((await ainput("Ответ: ")).strip())
         if not 1 <= playfulness <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['playfulness'] = playfulness
 
         print("\n-Насколько сильно линяющим кот может быть (макс.)? (1-5)")
-        shedding = int(input("Ответ: ").strip())
+        shedding = int((await ainput("Ответ: ")).strip())
         if not 1 <= shedding <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['shedding'] = shedding
 
         print("\n-Насколько придирчивым к уходу кот может быть (макс.)? (1-5)")
-        grooming = int(input("Ответ: ").strip())
+        grooming = int((await ainput("Ответ: ")).strip())
         if not 1 <= grooming <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['grooming'] = grooming
 
         print("\n-Какая оценка здоровья может быть (мин.)? (1-5)")
-        general_health = int(input("Ответ: ").strip())
+        general_health = int((await ainput("Ответ: ")).strip())
         if not 1 <= general_health <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['general_health'] = general_health
 
     except ValueError as e:
         print('Неверная команда')
-        return
+        return None
 
-    filtered_breeds = []
-    for breed in breeds_cats:
-        results = await get_breeds_async([breed], is_cat=True)
-        breed_info = results[0]
+    return client_answers
 
-        breed_shedding = breed_info[8] if breed_info[8] != 'N/A' else 0
-        breed_friendly = breed_info[9] if breed_info[9] != 'N/A' else 0
-        breed_playful = breed_info[10] if breed_info[10] != 'N/A' else 0
-        breed_grooming = breed_info[11] if breed_info[11] != 'N/A' else 0
-        breed_general_health = breed_info[15] if breed_info[15] != 'N/A' else 0
+async def cat_questions(session, breeds_cats):
+    warming = asyncio.create_task(warm_breeds(session, 'cat', breeds_cats))
+    try:
+        client_answers = await ask_cat_questions()
+    finally:
+        warming.cancel()
+    if client_answers is None:
+        return
 
-        if (int(breed_shedding) <= client_answers['shedding'] and
-                int(breed_friendly) >= client_answers['family_friendly'] and
-                int(breed_playful) >= client_answers['playfulness'] and
-                int(breed_grooming) <= client_answers['grooming'] and
-                int(breed_general_health) >= client_answers['general_health']):
-            filtered_breeds.append(breed)
+    ranked_breeds, matching = await start_matching(session, 'cat', breeds_cats, client_answers)
+    images = asyncio.create_task(prefetch_breed_images(breed for _, breed in ranked_breeds))
+    try:
+        await cat_results_pages(session, client_answers, ranked_breeds, matching)
+    finally:
+        matching.cancel()
+        images.cancel()
 
-    if not filtered_breeds:
+async def cat_results_pages(session, client_answers, ranked_breeds, matching):
+    if not ranked_breeds:
         print("\nНет подходящих пород по вашим критериям.")
-        input("Нажмите Enter чтобы продолжить...")
+        await ainput("Нажмите Enter чтобы продолжить...")
         return
 
-    pages = {i + 1: {'breed': breed}
-             for i, breed in enumerate(filtered_breeds)}
     page = 1
-    last_page = len(pages)
 
     while True:
+        last_page = len(ranked_breeds)
         os.system('cls')
-        print(f"=== Подходящие породы кошек (страница {page}/{last_page}) ===")
+        print(f"=== Подходящие породы кошек (место {page}/{last_page}) ===")
+        if not matching.done():
+            print("(поиск подходящих пород продолжается...)")
         print("Ваши предпочтения:")
         print(f"- Линька: {client_answers['shedding']}/5")
         print(f"- Дружелюбие: {client_answers['family_friendly']}/5")
@@ -334,26 +1789,30 @@ async def cat_questions(breeds_cats):
         print(f"- Общее здоровье: {client_answers['general_health']}/5")
         print("-" * 50)
 
-        current_breed = pages[page]['breed']
-        results = await get_breeds_async([current_breed], is_cat=True)
+        distance, current_breed = ranked_breeds[page - 1]
+        results = await get_breeds_async(session, [current_breed], is_cat=True)
         breed_info = results[0]
 
-        print(f"\nПорода: {breed_info[0]}")
-        print(f"Ссылка на картинку: {breed_info[1]}")
-        print(f"Длина: {breed_info[2]}")
-        print(f"Место происхождения: {breed_info[3]}")
-        print(f"Мин. вес: {breed_info[4]} фунтов")
-        print(f"Макс. вес: {breed_info[5]} фунтов")
-        print(f"Мин. продолжительность жизни: {breed_info[6]} лет")
-        print(f"Макс. продолжительность жизни: {breed_info[7]} лет")
-        print(f"Линька: {breed_info[8]}/5 (ваш выбор: {client_answers['shedding']})")
-        print(f"Дружелюбие: {breed_info[9]}/5 (ваш выбор: {client_answers['family_friendly']})")
-        print(f"Игривость: {breed_info[10]}/5 (ваш выбор: {client_answers['playfulness']})")
-        print(f"Уход: {breed_info[11]}/5 (ваш выбор: {client_answers['grooming']})")
-        print(f"Насколько хорошо кошка ладит с другими домашними животными в доме (от 1 до 5): {breed_info[12]}")
-        print(f"Насколько хорошо кошка ладит с детьми (от 1 до 5): {breed_info[13]}")
-        print(f"Оценка интеллекта (от 1 до 5): {breed_info[14]}")
-        print(f"Здоровье: {breed_info[15]}/5 (ваш выбор: {client_answers['general_health']})")
+        print(f"\nПорода: {breed_info.name}")
+        print(f"Совпадение с вашими ответами: {match_percent('cat', distance)}%")
+        print(f"Ссылка на картинку: {fmt(breed_info.image_link)}")
+        thumbnail = breed_image(breed_info)
+        if thumbnail is not None:
+            print(f"Картинка в кэше: {thumbnail}")
+        print(f"Длина: {fmt(breed_info.length)}")
+        print(f"Место происхождения: {fmt(breed_info.origin)}")
+        print(f"Мин. вес: {fmt(breed_info.min_weight)} фунтов")
+        print(f"Макс. вес: {fmt(breed_info.max_weight)} фунтов")
+        print(f"Мин. продолжительность жизни: {fmt(breed_info.min_life_expectancy)} лет")
+        print(f"Макс. продолжительность жизни: {fmt(breed_info.max_life_expectancy)} лет")
+        print(f"Линька: {fmt(breed_info.shedding)}/5 (ваш выбор: {client_answers['shedding']})")
+        print(f"Дружелюбие: {fmt(breed_info.family_friendly)}/5 (ваш выбор: {client_answers['family_friendly']})")
+        print(f"Игривость: {fmt(breed_info.playfulness)}/5 (ваш выбор: {client_answers['playfulness']})")
+        print(f"Уход: {fmt(breed_info.grooming)}/5 (ваш выбор: {client_answers['grooming']})")
+        print(f"Насколько хорошо кошка ладит с другими домашними животными в доме (от 1 до 5): {fmt(breed_info.other_pets_friendly)}")
+        print(f"Насколько хорошо кошка ладит с детьми (от 1 до 5): {fmt(breed_info.children_friendly)}")
+        print(f"Оценка интеллекта (от 1 до 5): {fmt(breed_info.intelligence)}")
+        print(f"Здоровье: {fmt(breed_info.general_health)}/5 (ваш выбор: {client_answers['general_health']})")
 
         if page == 1 and last_page > 1:
             menu = '1-След. порода\n0-Выход\nВведите действие: '
@@ -364,7 +1823,7 @@ async def cat_questions(breeds_cats):
         else:
             menu = '1-След. порода\n2-Пред. порода\n0-Выход\nВведите действие: '
 
-        choice = input(menu).strip()
+        choice = (await ainput(menu)).strip()
 
         if choice == '0':
             break
@@ -374,99 +1833,97 @@ async def cat_questions(breeds_cats):
             page -= 1
         else:
             print('Неверная команда')
-            input('Нажмите Enter чтобы продолжить...')
+            await ainput('Нажмите Enter чтобы продолжить...')
 
-async def dog_questions(breeds_dogs):
+async def ask_dog_questions():
     client_answers = {}
     try:
         print("\n-Насколько энергичную собаку Вы хотели бы (макс.)? (1-5)")
-        energy = int(input("Ответ: ").strip())
+        energy = int((await ainput("Ответ: ")).strip())
         if not 1 <= energy <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['energy'] = energy
 
         print("\n-Насколько вокальную собаку Вы хотели бы (макс.)? (1-5)")
-        barking = int(input("Ответ: ").strip())
+        barking = int((await ainput("Ответ: ")).strip())
         if not 1 <= barking <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['barking'] = barking
 
         print("\n-Насколько сильно линяющей собака может быть (макс.)? (1-5)")
-        shedding = int(input("Ответ: ").strip())
+        shedding = int((await ainput("Ответ: ")).strip())
         if not 1 <= shedding <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['shedding'] = shedding
 
         print("\n-Насколько придирчивой к уходу собака может быть (макс.)? (1-5)")
-        grooming = int(input("Ответ: ").strip())
+        grooming = int((await ainput("Ответ: ")).strip())
         if not 1 <= grooming <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['grooming'] = grooming
 
         print("\n-Насколько способной к обучению собака может быть (мин.)? (1-5)")
-        trainability = int(input("Ответ: ").strip())
+        trainability = int((await ainput("Ответ: ")).strip())
         if not 1 <= trainability <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['trainability'] = trainability
 
         print("\n-Насколько дружелюбной собака может быть (мин.)? (1-5)")
-        good_with_strangers = int(input("Ответ: ").strip())
+        good_with_strangers = int((await ainput("Ответ: ")).strip())
         if not 1 <= good_with_strangers <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['good_with_strangers'] = good_with_strangers
 
         print("\n-Насколько хорошие защитные качества может иметь собака (мин.)? (1-5)")
-        protectiveness = int(input("Ответ: ").strip())
+        protectiveness = int((await ainput("Ответ: ")).strip())
         if not 1 <= protectiveness <= 5:
             print("Должно быть число от 1 до 5")
-            return
+            return None
         client_answers['protectiveness'] = protectiveness
 
     except ValueError as e:
         print('Неверная команда')
+        return None
+
+    return client_answers
+
+async def dog_questions(session, breeds_dogs):
+    warming = asyncio.create_task(warm_breeds(session, 'dog', breeds_dogs))
+    try:
+        client_answers = await ask_dog_questions()
+    finally:
+        warming.cancel()
+    if client_answers is None:
         return
 
-    filtered_breeds = []
-    for breed in breeds_dogs:
-        results = await get_breeds_async([breed], is_cat=False)
-        breed_info = results[0]
+    ranked_breeds, matching = await start_matching(session, 'dog', breeds_dogs, client_answers)
+    images = asyncio.create_task(prefetch_breed_images(breed for _, breed in ranked_breeds))
+    try:
+        await dog_results_pages(session, client_answers, ranked_breeds, matching)
+    finally:
+        matching.cancel()
+        images.cancel()
 
-        breed_shedding = breed_info[12] if breed_info[12] != 'N/A' else 0
-        breed_barking = breed_info[13] if breed_info[13] != 'N/A' else 0
-        breed_energy = breed_info[14] if breed_info[14] != 'N/A' else 0
-        breed_protectiveness = breed_info[15] if breed_info[15] != 'N/A' else 0
-        breed_trainability = breed_info[16] if breed_info[16] != 'N/A' else 0
-        breed_good_with_strangers = breed_info[19] if breed_info[19] != 'N/A' else 0
-        breed_grooming = breed_info[20] if breed_info[20] != 'N/A' else 0
-
-        if (int(breed_shedding) <= client_answers['shedding'] and
-                int(breed_barking) <= client_answers['barking'] and
-                int(breed_energy) <= client_answers['energy'] and
-                int(breed_protectiveness) >= client_answers['protectiveness'] and
-                int(breed_trainability) >= client_answers['trainability'] and
-                int(breed_good_with_strangers) >= client_answers['good_with_strangers'] and
-                int(breed_grooming) <= client_answers['grooming']):
-            filtered_breeds.append(breed)
-
-    if not filtered_breeds:
+async def dog_results_pages(session, client_answers, ranked_breeds, matching):
+    if not ranked_breeds:
         print("\nНет подходящих пород по вашим критериям.")
-        input("Нажмите Enter чтобы продолжить...")
+        await ainput("Нажмите Enter чтобы продолжить...")
         return
 
-    pages = {i + 1: {'breed': breed}
-             for i, breed in enumerate(filtered_breeds)}
     page = 1
-    last_page = len(pages)
 
     while True:
+        last_page = len(ranked_breeds)
         os.system('cls')
-        print(f"=== Подходящие породы собак (страница {page}/{last_page}) ===")
+        print(f"=== Подходящие породы собак (место {page}/{last_page}) ===")
+        if not matching.done():
+            print("(поиск подходящих пород продолжается...)")
         print("Ваши предпочтения:")
         print(f"- Линька: {client_answers['shedding']}/5")
         print(f"- Лай/голос: {client_answers['barking']}/5")
@@ -477,34 +1934,38 @@ async def dog_questions(breeds_dogs):
         print(f"- Уход: {client_answers['grooming']}/5")
         print("-" * 50)
 
-        current_breed = pages[page]['breed']
-        results = await get_breeds_async([current_breed], is_cat=False)
+        distance, current_breed = ranked_breeds[page - 1]
+        results = await get_breeds_async(session, [current_breed], is_cat=False)
         breed_info = results[0]
 
-        print(f"\nПорода: {breed_info[0]}")
-        print(f"Ссылка на картинку: {breed_info[1]}")
+        print(f"\nПорода: {breed_info.name}")
+        print(f"Совпадение с вашими ответами: {match_percent('dog', distance)}%")
+        print(f"Ссылка на картинку: {fmt(breed_info.image_link)}")
+        thumbnail = breed_image(breed_info)
+        if thumbnail is not None:
+            print(f"Картинка в кэше: {thumbnail}")
         print("--Пол: male--")
-        print(f"Мин. рост: {breed_info[2]} дюймов")
-        print(f"Макс. рост: {breed_info[3]} дюймов")
-        print(f"Мин. вес: {breed_info[4]} фунтов")
-        print(f"Макс. вес: {breed_info[5]} фунтов")
+        print(f"Мин. рост: {fmt(breed_info.min_height_male)} дюймов")
+        print(f"Макс. рост: {fmt(breed_info.max_height_male)} дюймов")
+        print(f"Мин. вес: {fmt(breed_info.min_weight_male)} фунтов")
+        print(f"Макс. вес: {fmt(breed_info.max_weight_male)} фунтов")
         print("--Пол: female--")
-        print(f"Мин. рост: {breed_info[6]} дюймов")
-        print(f"Макс. рост: {breed_info[7]} дюймов")
-        print(f"Мин. вес: {breed_info[8]} фунтов")
-        print(f"Макс. вес: {breed_info[9]} фунтов")
-        print(f"Мин. продолжительность жизни: {breed_info[10]} лет")
-        print(f"Макс. продолжительность жизни: {breed_info[11]} лет")
-        print(f"Линька: {breed_info[12]}/5 (ваш выбор: {client_answers['shedding']})")
-        print(f"Склонность к лаю: {breed_info[13]}/5 (ваш выбор: {client_answers['barking']})")
-        print(f"Энергичность: {breed_info[14]}/5 (ваш выбор: {client_answers['energy']})")
-        print(f"Защитные качества: {breed_info[15]}/5 (ваш выбор: {client_answers['protectiveness']})")
-        print(f"Обучаемость: {breed_info[16]}/5 (ваш выбор: {client_answers['trainability']})")
-        print(f"Дружелюбие: {breed_info[19]}/5 (ваш выбор: {client_answers['good_with_strangers']})")
-        print(f"Уход: {breed_info[20]}/5 (ваш выбор: {client_answers['grooming']})")
-        print(f"Насколько сильно проявляется слюнотечение (от 1 до 5): {breed_info[21]}")
-        print(f"Насколько длинная шерсть (от 1 до 5): {breed_info[22]}")
-        print(f"Насколько игрива собака (от 1 до 5): {breed_info[23]}")
+        print(f"Мин. рост: {fmt(breed_info.min_height_female)} дюймов")
+        print(f"Макс. рост: {fmt(breed_info.max_height_female)} дюймов")
+        print(f"Мин. вес: {fmt(breed_info.min_weight_female)} фунтов")
+        print(f"Макс. вес: {fmt(breed_info.max_weight_female)} фунтов")
+        print(f"Мин. продолжительность жизни: {fmt(breed_info.min_life_expectancy)} лет")
+        print(f"Макс. продолжительность жизни: {fmt(breed_info.max_life_expectancy)} лет")
+        print(f"Линька: {fmt(breed_info.shedding)}/5 (ваш выбор: {client_answers['shedding']})")
+        print(f"Склонность к лаю: {fmt(breed_info.barking)}/5 (ваш выбор: {client_answers['barking']})")
+        print(f"Энергичность: {fmt(breed_info.energy)}/5 (ваш выбор: {client_answers['energy']})")
+        print(f"Защитные качества: {fmt(breed_info.protectiveness)}/5 (ваш выбор: {client_answers['protectiveness']})")
+        print(f"Обучаемость: {fmt(breed_info.trainability)}/5 (ваш выбор: {client_answers['trainability']})")
+        print(f"Дружелюбие: {fmt(breed_info.good_with_strangers)}/5 (ваш выбор: {client_answers['good_with_strangers']})")
+        print(f"Уход: {fmt(breed_info.grooming)}/5 (ваш выбор: {client_answers['grooming']})")
+        print(f"Насколько сильно проявляется слюнотечение (от 1 до 5): {fmt(breed_info.drooling)}")
+        print(f"Насколько длинная шерсть (от 1 до 5): {fmt(breed_info.coat_length)}")
+        print(f"Насколько игрива собака (от 1 до 5): {fmt(breed_info.playfulness)}")
 
         if page == 1 and last_page > 1:
             menu = '1-След. порода\n0-Выход\nВведите действие: '
@@ -515,7 +1976,7 @@ async def dog_questions(breeds_dogs):
         else:
             menu = '1-След. порода\n2-Пред. порода\n0-Выход\nВведите действие: '
 
-        choice = input(menu).strip()
+        choice = (await ainput(menu)).strip()
 
         if choice == '0':
             break
@@ -525,38 +1986,781 @@ async def dog_questions(breeds_dogs):
             page -= 1
         else:
             print('Неверная команда')
-            input('Нажмите Enter чтобы продолжить...')
+            await ainput('Нажмите Enter чтобы продолжить...')
+
+class CatalogSnapshot:
+    __slots__ = ('generation', 'breeds', 'indexes', 'names', 'bodies')
+
+    def __init__(self, breeds, indexes, names, bodies=None, generation=0):
+        self.generation = generation
+        self.breeds = breeds
+        self.indexes = indexes
+        self.names = names
+        self.bodies = {} if bodies is None else bodies
+
+    @classmethod
+    def from_lists(cls, breeds_cats, breeds_dogs, generation=0):
+        breeds = {'cat': breeds_cats, 'dog': breeds_dogs}
+        indexes = {species: get_trait_index(species, items) for species, items in breeds.items()}
+        names = {species: {normalize_name(breed.name): i for i, breed in enumerate(items)}
+                 for species, items in breeds.items()}
+        return cls(breeds, indexes, names, generation=generation)
+
+    def updated(self, breeds_cats, breeds_dogs):
+        breeds, indexes, names, bodies = dict(self.breeds), dict(self.indexes), dict(self.names), dict(self.bodies)
+        changed = False
+        for species, fresh in (('cat', breeds_cats), ('dog', breeds_dogs)):
+            merged = merge_breeds(self.breeds[species], fresh)
+            if merged is None:
+                continue
+            changed = True
+            breeds[species] = merged
+            indexes[species] = get_trait_index(species, merged)
+            names[species] = {normalize_name(breed.name): i for i, breed in enumerate(merged)}
+            bodies.pop(species, None)
+        if not changed:
+            return None
+        return CatalogSnapshot(breeds, indexes, names, bodies, self.generation + 1)
+
+    def find(self, species, name):
+        i = self.names[species].get(normalize_name(name))
+        return None if i is None else self.breeds[species][i]
+
+    def list_body(self, species):
+        body = self.bodies.get(species)
+        if body is None:
+            body = json.dumps([asdict(breed) for breed in self.breeds[species]], ensure_ascii=False).encode()
+            self.bodies[species] = body
+        return body
+
+class SnapshotRef:
+    __slots__ = ('current',)
+
+    def __init__(self, snapshot):
+        self.current = snapshot
+
+def merge_breeds(current, fresh):
+    current_by_name = {normalize_name(breed.name): breed for breed in current}
+    merged = []
+    changed = len(current) != len(fresh)
+    for breed in fresh:
+        old = current_by_name.get(normalize_name(breed.name))
+        if old is not None and hash(old) == hash(breed) and old == breed:
+            merged.append(old)
+        else:
+            merged.append(breed)
+            changed = True
+    return merged if changed else None
 
-async def main():
-    breeds_cats, breeds_dogs = await fetch_breeds()
+async def refresh_snapshot(session, snapshot):
+    try:
+        breeds_cats, breeds_dogs, complete = await crawl_catalog(session, publish=False)
+    except Exception as e:
+        print(f"Ошибка обновления каталога: {str(e)}")
+        return None
+    if not complete:
+        print("Каталог загружен не полностью, обновление пропущено")
+        return None
+    if not breeds_cats or not breeds_dogs:
+        return None
+    return snapshot.updated(breeds_cats, breeds_dogs) or snapshot
+
+def publish_catalog(snapshot):
+    fetched_at = time.time()
+    for species, breeds in snapshot.breeds.items():
+        for breed in breeds:
+            catalog_put(species, breed, fetched_at)
+    breed_search.retain(snapshot.names)
+
+async def refresh_catalog(session, catalog, interval=CATALOG_REFRESH_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = await refresh_snapshot(session, catalog.current)
+        if snapshot is not None:
+            # the refresh crawl never touches the live catalog, readers see it only with the swap
+            catalog.current = snapshot
+            publish_catalog(snapshot)
+
+async def load_snapshot(session, generation=0):
+    if CATALOG_FILE:
+        snapshot = load_catalog_file(CATALOG_FILE)
+        if snapshot is not None:
+            snapshot.generation = generation
+        return snapshot
+    breeds_cats, breeds_dogs = await fetch_breeds(session)
     if breeds_cats is None or breeds_dogs is None:
-        print("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.")
-        exit(-1)
+        return None
+    return CatalogSnapshot.from_lists(breeds_cats, breeds_dogs, generation)
 
+async def main():
+    open_breed_cache()
+    open_image_cache()
+    try:
+        async with metrics_dump():
+            await main_menu()
+    finally:
+        await close_image_cache()
+        close_breed_cache()
+        close_catalog_files()
+
+async def main_menu():
+    async with create_session() as session:
+        snapshot = await load_snapshot(session)
+        if snapshot is None:
+            print("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.")
+            exit(-1)
+
+        catalog = SnapshotRef(snapshot)
+        refresher = None if OFFLINE else asyncio.create_task(refresh_catalog(session, catalog))
+        try:
+            while True:
+                snapshot = catalog.current
+                breeds_cats, breeds_dogs = snapshot.breeds['cat'], snapshot.breeds['dog']
+                os.system('cls')
+                print("=== Главное меню ===")
+                print("1 - Просмотр пород (постранично)")
+                print("2 - Тест подбора домашнего животного")
+                print("3 - Поиск породы")
+                print("0 - Выход")
+                choice = (await ainput("Выберите действие: ")).strip()
+
+                if choice == '0':
+                    break
+                elif choice == '1':
+                    combined_breeds = []
+                    max_len = max(len(breeds_cats), len(breeds_dogs))
+                    for i in range(max_len):
+                        if i < len(breeds_cats):
+                            combined_breeds.append(('cat', breeds_cats[i]))
+                        if i < len(breeds_dogs):
+                            combined_breeds.append(('dog', breeds_dogs[i]))
+                    await show_breeds_pages(session, combined_breeds)
+                elif choice == '2':
+                    await pet_selection_test(session, breeds_cats, breeds_dogs)
+                elif choice == '3':
+                    await search_breeds(session)
+                else:
+                    print('Неверная команда')
+                    await ainput('Нажмите Enter чтобы продолжить...')
+        finally:
+            if refresher is not None:
+                refresher.cancel()
+
+SHM_PREFIX = os.getenv('SHM_PREFIX', 'catanddog')
+SNAPSHOT_MAGIC = b'CDSNAP01'
+SHM_POLL_INTERVAL = float(os.getenv('SHM_POLL_INTERVAL', 1))
+
+def attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks; workers share the loader's resource tracker, which already owns the segment
+        return shared_memory.SharedMemory(name=name)
+
+def pack_snapshot(snapshot):
+    header = {'generation': snapshot.generation, 'created_at': time.time(), 'species': {}}
+    chunks = []
+    size = 0
+
+    def add(data):
+        nonlocal size
+        offset = (size + 7) // 8 * 8
+        chunks.append((offset, data))
+        size = offset + (data.nbytes if isinstance(data, np.ndarray) else len(data))
+        return offset
+
+    def add_array(array):
+        return [add(np.ascontiguousarray(array)), array.dtype.str, list(array.shape)]
+
+    for species, breeds in snapshot.breeds.items():
+        records = [json.dumps(asdict(breed), ensure_ascii=False).encode() for breed in breeds]
+        spans = np.empty((len(records), 2), dtype=np.int64)
+        position = 1
+        for i, record in enumerate(records):
+            spans[i] = (position, position + len(record))
+            position += len(record) + 1
+        body = b'[' + b','.join(records) + b']'
+        names = '\n'.join(normalize_name(breed.name) for breed in breeds).encode()
+        header['species'][species] = {
+            'body': [add(body), len(body)],
+            'names': [add(names), len(names)],
+            'spans': add_array(spans),
+            'arrays': {name: add_array(array) for name, array in snapshot.indexes[species].arrays().items()}
+        }
+    return header, chunks, size
+
+def layout_snapshot(snapshot):
+    header, chunks, size = pack_snapshot(snapshot)
+    header_bytes = json.dumps(header).encode()
+    data_start = (16 + len(header_bytes) + 7) // 8 * 8
+    return header_bytes, chunks, data_start, data_start + size
+
+def write_snapshot(buf, header_bytes, chunks, data_start):
+    buf[:8] = SNAPSHOT_MAGIC
+    buf[8:16] = len(header_bytes).to_bytes(8, 'little')
+    buf[16:16 + len(header_bytes)] = header_bytes
+    for offset, data in chunks:
+        if isinstance(data, np.ndarray):
+            target = np.ndarray(data.shape, dtype=data.dtype, buffer=buf, offset=data_start + offset)
+            target[...] = data
+            del target
+        else:
+            buf[data_start + offset:data_start + offset + len(data)] = data
+
+def publish_snapshot(snapshot, prefix):
+    header_bytes, chunks, data_start, size = layout_snapshot(snapshot)
+    shm = shared_memory.SharedMemory(name=f'{prefix}-{snapshot.generation}', create=True, size=size)
+    write_snapshot(shm.buf, header_bytes, chunks, data_start)
+    return shm
+
+def export_snapshot(snapshot, path):
+    header_bytes, chunks, data_start, size = layout_snapshot(snapshot)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb+') as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as mapped:
+            buf = memoryview(mapped)
+            write_snapshot(buf, header_bytes, chunks, data_start)
+            buf.release()
+            mapped.flush()
+    os.replace(tmp_path, path)
+    return size
+
+def import_snapshot(path):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        snapshot, created_at = read_snapshot(memoryview(mapped))
+    except ValueError:
+        gc.collect()
+        close_shared_memory([mapped])
+        raise
+    return mapped, snapshot, created_at
+
+class SharedBreedList:
+    __slots__ = ('species', 'body', 'spans')
+
+    def __init__(self, species, body, spans):
+        self.species = species
+        self.body = body
+        self.spans = spans
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.spans[i]
+        return parse_breed(self.species, json.loads(bytes(self.body[start:end])))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def read_snapshot(buf):
+    size = len(buf)
+    if size < 16 or bytes(buf[:8]) != SNAPSHOT_MAGIC:
+        raise ValueError("Неизвестный формат снимка каталога")
+    header_length = int.from_bytes(buf[8:16], 'little')
+    if 16 + header_length > size:
+        raise ValueError("Снимок каталога обрезан")
+    header = json.loads(bytes(buf[16:16 + header_length]))
+    data_start = (16 + header_length + 7) // 8 * 8
+
+    def check(offset, length):
+        if not (isinstance(offset, int) and isinstance(length, int) and offset >= 0 and length >= 0):
+            raise ValueError("Снимок каталога повреждён")
+        if data_start + offset + length > size:
+            raise ValueError("Снимок каталога обрезан")
+
+    def view(entry, rows):
+        offset, dtype, shape = entry
+        dtype = np.dtype(dtype)
+        if dtype.hasobject or not shape or shape[0] != rows:
+            raise ValueError("Снимок каталога повреждён")
+        check(offset, dtype.itemsize * math.prod(shape))
+        return np.ndarray(shape, dtype=dtype, buffer=buf, offset=data_start + offset)
+
+    def block(entry):
+        offset, length = entry
+        check(offset, length)
+        return buf[data_start + offset:data_start + offset + length]
+
+    breeds, indexes, names, bodies = {}, {}, {}, {}
+    try:
+        for species, meta in header['species'].items():
+            species_names = bytes(block(meta['names'])).decode()
+            species_names = species_names.split('\n') if species_names else []
+            count = len(species_names)
+            bodies[species] = block(meta['body'])
+            spans = view(meta['spans'], count)
+            if spans.dtype.kind != 'i' or spans.shape != (count, 2) or \
+                    count and (spans.min() < 0 or spans.max() > len(bodies[species])):
+                raise ValueError("Снимок каталога повреждён")
+            breeds[species] = SharedBreedList(species, bodies[species], spans)
+            index = TraitIndex(species, breeds[species],
+                               {name: view(entry, count) for name, entry in meta['arrays'].items()})
+            shape = (count, len(MATCH_RULES[species]))
+            if any(array.shape != shape for array in (index.rule_matrix, index.rule_vectors, index.rule_missing)):
+                raise ValueError("Снимок каталога повреждён")
+            indexes[species] = index
+            names[species] = {name: i for i, name in enumerate(species_names)}
+        return CatalogSnapshot(breeds, indexes, names, bodies, header['generation']), header['created_at']
+    except (KeyError, TypeError, IndexError) as e:
+        raise ValueError(f"Снимок каталога повреждён: {str(e)}") from e
+
+def attach_snapshot(prefix, generation):
+    shm = attach_shared_memory(f'{prefix}-{generation}')
+    snapshot, _ = read_snapshot(shm.buf)
+    return shm, snapshot
+
+snapshot_key = web.AppKey('snapshot', SnapshotRef)
+shared_prefix_key = web.AppKey('shared_prefix', str)
+
+def json_error(error_class, message):
+    return error_class(text=json.dumps({'error': message}, ensure_ascii=False), content_type='application/json')
+
+def parse_answers(species, query):
+    try:
+        return validate_answers(species, query)
+    except ValueError as e:
+        raise json_error(web.HTTPBadRequest, str(e))
+
+async def handle_health(request):
+    snapshot = request.app[snapshot_key].current
+    return web.json_response({'status': 'ok', 'generation': snapshot.generation,
+                              'cats': len(snapshot.breeds['cat']), 'dogs': len(snapshot.breeds['dog'])})
+
+async def handle_list_breeds(request):
+    species = request.match_info['species']
+    body = request.app[snapshot_key].current.list_body(species)
+    return web.Response(body=body, content_type='application/json')
+
+async def handle_get_breed(request):
+    species = request.match_info['species']
+    name = request.match_info['name']
+    breed = request.app[snapshot_key].current.find(species, name)
+    if breed is None:
+        raise json_error(web.HTTPNotFound, f"Порода {name} не найдена")
+    return web.json_response(asdict(breed), dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+async def handle_search(request):
+    query = request.query.get('q', '').strip()
+    if not query:
+        raise json_error(web.HTTPBadRequest, "Не указан параметр q")
+    species = request.query.get('species')
+    if species not in (None, 'cat', 'dog'):
+        raise json_error(web.HTTPBadRequest, "Параметр species должен быть cat или dog")
+    try:
+        limit = int(request.query.get('limit', SEARCH_LIMIT))
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "Параметр limit должен быть числом")
+    limit = max(1, min(limit, 100))
+
+    results = [{
+        'species': breed_species,
+        'name': breed.name,
+        'origin': getattr(breed, 'origin', None),
+        'score': round(score, 3)
+    } for score, breed_species, breed in breed_search.search(query, species, limit)]
+    return web.json_response({'query': query, 'results': results},
+                             dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+async def handle_image(request):
+    species = request.match_info['species']
+    name = request.match_info['name']
+    breed = request.app[snapshot_key].current.find(species, name)
+    if breed is None:
+        raise json_error(web.HTTPNotFound, f"Порода {name} не найдена")
+    if not breed.image_link or image_cache is None:
+        raise json_error(web.HTTPNotFound, f"Нет картинки для породы {name}")
+    try:
+        result = await image_cache.get(breed.image_link, thumbnail=request.query.get('size') != 'full')
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError) as e:
+        raise json_error(web.HTTPBadGateway, f"Не удалось загрузить картинку: {str(e)}")
+    if result is None:
+        raise json_error(web.HTTPNotFound, f"Картинка породы {name} не загружена (офлайн-режим)")
+    path, content_type = result
+    return web.FileResponse(path, headers={'Content-Type': content_type, 'Cache-Control': 'public, max-age=86400'})
+
+async def images_context(app):
+    open_image_cache()
+    prefetch = None
+    # with several workers the loader prefetches once for all of them
+    if IMAGE_PREFETCH and image_cache is not None and shared_prefix_key not in app:
+        snapshot = app[snapshot_key].current
+        prefetch = asyncio.create_task(prefetch_breed_images([*snapshot.breeds['cat'], *snapshot.breeds['dog']]))
+    try:
+        yield
+    finally:
+        if prefetch is not None:
+            prefetch.cancel()
+        await close_image_cache()
+
+async def handle_match(request):
+    species = request.match_info['species']
+    client_answers = parse_answers(species, request.query)
+    try:
+        k = int(request.query.get('k', MATCH_TOP_K))
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "Параметр k должен быть числом")
+    k = max(1, min(k, 100))
+
+    index = request.app[snapshot_key].current.indexes[species]
+    top, distances, matches = index.rank_many(index.thresholds(client_answers)[None, :], k)
+    results = [{
+        'name': index.breeds[i].name,
+        'distance': round(distance, 3),
+        'match_percent': match_percent(species, distance),
+        'matches_all': match
+    } for i, distance, match in zip(top[0].tolist(), distances[0].tolist(), matches[0].tolist())]
+    return web.json_response({'species': species, 'answers': client_answers, 'results': results},
+                             dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+async def service_context(app):
+    open_breed_cache()
+    try:
+        async with create_session() as session:
+            snapshot = await load_snapshot(session)
+            if snapshot is None:
+                raise RuntimeError("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.")
+            app[snapshot_key] = SnapshotRef(snapshot)
+            del snapshot
+            refresher = None if OFFLINE else asyncio.create_task(refresh_catalog(session, app[snapshot_key]))
+            try:
+                yield
+            finally:
+                if refresher is not None:
+                    refresher.cancel()
+                    await asyncio.gather(refresher, return_exceptions=True)
+                app[snapshot_key].current = None
+    finally:
+        close_breed_cache()
+        close_catalog_files()
+
+def index_snapshot(snapshot):
+    for species, breeds in snapshot.breeds.items():
+        for row in range(len(breeds)):
+            breed_search.add_row(species, breeds, row)
+    breed_search.retain(snapshot.names)
+
+async def poll_shared_snapshot(app, generation_view, attached):
     while True:
-        os.system('cls')
-        print("=== Главное меню ===")
-        print("1 - Просмотр пород (постранично)")
-        print("2 - Тест подбора домашнего животного")
-        print("0 - Выход")
-        choice = input("Выберите действие: ").strip()
+        await asyncio.sleep(SHM_POLL_INTERVAL)
+        generation = int(generation_view[0])
+        if generation != app[snapshot_key].current.generation:
+            try:
+                shm, snapshot = attach_snapshot(app[shared_prefix_key], generation)
+            except FileNotFoundError:
+                continue
+            app[snapshot_key].current = snapshot
+            index_snapshot(snapshot)
+            attached.append(shm)
+            del snapshot
+            gc.collect()
+        attached[:-1] = close_shared_memory(attached[:-1])
+
+def close_shared_memory(segments):
+    still_open = []
+    for shm in segments:
+        try:
+            shm.close()
+        except BufferError:
+            still_open.append(shm)
+    return still_open
+
+async def shared_service_context(app):
+    control = attach_shared_memory(f'{app[shared_prefix_key]}-ctl')
+    generation_view = np.ndarray((1,), dtype=np.int64, buffer=control.buf)
+    shm, snapshot = attach_snapshot(app[shared_prefix_key], int(generation_view[0]))
+    attached = [shm]
+    app[snapshot_key] = SnapshotRef(snapshot)
+    index_snapshot(snapshot)
+    del snapshot
+    poller = asyncio.create_task(poll_shared_snapshot(app, generation_view, attached))
+    try:
+        yield
+    finally:
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+
+    app[snapshot_key].current = None
+    del generation_view
+    gc.collect()
+    close_shared_memory(attached + [control])
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8',
+                        headers={'Cache-Control': 'no-store'})
+
+async def metrics_context(app):
+    path = METRICS_DUMP_PATH
+    if path and shared_prefix_key in app:
+        path = f'{path}.{os.getpid()}'
+    async with metrics_dump(path):
+        yield
+
+def create_app(shared_prefix=None):
+    app = web.Application()
+    if shared_prefix is None:
+        app.cleanup_ctx.append(service_context)
+    else:
+        app[shared_prefix_key] = shared_prefix
+        app.cleanup_ctx.append(shared_service_context)
+    app.cleanup_ctx.append(images_context)
+    if METRICS_ENABLED:
+        app.cleanup_ctx.append(metrics_context)
+        app.router.add_get('/metrics', handle_metrics)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/breeds/{species:cat|dog}', handle_list_breeds)
+    app.router.add_get('/breeds/{species:cat|dog}/{name}', handle_get_breed)
+    app.router.add_get('/breeds/{species:cat|dog}/{name}/image', handle_image)
+    app.router.add_get('/match/{species:cat|dog}', handle_match)
+    app.router.add_get('/search', handle_search)
+    return app
+
+def run_server(host, port, access_log=False):
+    web.run_app(create_app(), host=host, port=port, access_log=web.access_logger if access_log else None)
+
+def run_worker(sock, shared_prefix, access_log=False):
+    web.run_app(create_app(shared_prefix), sock=sock, print=None,
+                access_log=web.access_logger if access_log else None)
+
+async def run_catalog_loader(sock, workers, access_log=False):
+    prefix = f'{SHM_PREFIX}-{os.getpid()}'
+    control = shared_memory.SharedMemory(name=f'{prefix}-ctl', create=True, size=8)
+    generation_view = np.ndarray((1,), dtype=np.int64, buffer=control.buf)
+    segments = {}
+    processes = []
+    prefetch = None
+    if os.name == 'posix':
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    open_breed_cache()
+    try:
+        async with create_session() as session:
+            snapshot = await load_snapshot(session, generation=1)
+            if snapshot is None:
+                print("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.")
+                return
+
+            current = None
+            while True:
+                if snapshot is not None and snapshot is not current:
+                    generation = snapshot.generation
+                    segments[generation] = publish_snapshot(snapshot, prefix)
+                    generation_view[0] = generation
+                    for old_generation in [g for g in segments if g < generation - 1]:
+                        segments.pop(old_generation).unlink()
+                    current = snapshot
+
+                if not processes:
+                    context = multiprocessing.get_context('spawn')
+                    for _ in range(workers):
+                        process = context.Process(target=run_worker, args=(sock, prefix, access_log), daemon=True)
+                        process.start()
+                        processes.append(process)
+                    host, port = sock.getsockname()[:2]
+                    print(f"======== Running on http://{host}:{port} ({workers} workers) ========")
+                    if IMAGE_PREFETCH and open_image_cache() is not None:
+                        prefetch = asyncio.create_task(
+                            prefetch_breed_images([*snapshot.breeds['cat'], *snapshot.breeds['dog']]))
+
+                await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+                snapshot = None if OFFLINE else await refresh_snapshot(session, current)
+    finally:
+        if prefetch is not None:
+            prefetch.cancel()
+        await close_image_cache()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        for shm in segments.values():
+            shm.close()
+            shm.unlink()
+        del generation_view
+        control.close()
+        control.unlink()
+        close_breed_cache()
+        snapshot = current = None
+        close_catalog_files()
+
+async def load_catalog(generation=0):
+    open_breed_cache()
+    try:
+        async with create_session() as session:
+            return await load_snapshot(session, generation)
+    finally:
+        close_breed_cache()
+
+async def export_catalog(path):
+    snapshot = await load_catalog()
+    if snapshot is None:
+        print("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.")
+        exit(-1)
+    size = export_snapshot(snapshot, path)
+    print(f"Каталог сохранён в {path} ({size} байт)")
+
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 2000))
+
+batch_state = None
+
+def init_batch_state(snapshot, k, shm=None):
+    global batch_state
+    names = {species: [json.dumps(breed.name, ensure_ascii=False) for breed in breeds]
+             for species, breeds in snapshot.breeds.items()}
+    max_distance = {species: max_match_distance(species) for species in snapshot.breeds}
+    batch_state = (shm, snapshot, names, max_distance, max(1, min(k, 100)))
+
+def init_batch_worker(prefix, generation, k):
+    shm, snapshot = attach_snapshot(prefix, generation)
+    init_batch_state(snapshot, k, shm)
+
+def match_profile_lines(first_line, lines):
+    _, snapshot, names, max_distance, k = batch_state
+    outputs = [None] * len(lines)
+    groups = {species: ([], []) for species in snapshot.indexes}
+    for i, line in enumerate(lines):
+        profile_id = first_line + i
+        try:
+            profile = json.loads(line)
+            if not isinstance(profile, dict):
+                raise ValueError("Профиль должен быть JSON-объектом")
+            profile_id = profile.get('id', profile_id)
+            species = profile.get('species')
+            if not isinstance(species, str) or species not in groups:
+                raise ValueError(f"Неизвестный вид: {species}")
+            answers = profile.get('answers', profile)
+            if not isinstance(answers, dict):
+                raise ValueError("Поле answers должно быть JSON-объектом")
+            client_answers = validate_answers(species, answers)
+        except ValueError as e:
+            outputs[i] = json.dumps({'id': profile_id, 'error': str(e)}, ensure_ascii=False)
+            continue
+        positions, rows = groups[species]
+        positions.append((i, profile_id))
+        rows.append([client_answers[trait] for trait, _, _ in MATCH_RULES[species]])
+
+    for species, (positions, rows) in groups.items():
+        index = snapshot.indexes[species]
+        if not positions or not len(index):
+            for i, profile_id in positions:
+                outputs[i] = json.dumps({'id': profile_id, 'species': species, 'results': []}, ensure_ascii=False)
+            continue
+        thresholds = np.array(rows, dtype=np.int8) * index.rule_signs
+        top, distances, matches = index.rank_many(thresholds, k)
+        distances = distances.astype(np.float64)
+        percents = np.maximum(0, np.round(100 * (1 - distances / max_distance[species]))).astype(np.int64)
+        species_names = names[species]
+        prefix = f', "species": "{species}", "results": ['
+        for (i, profile_id), top_row, distance_row, percent_row, match_row in zip(
+                positions, top.tolist(), np.round(distances, 3).tolist(), percents.tolist(), matches.tolist()):
+            results = ', '.join(
+                f'{{"name": {species_names[j]}, "distance": {distance!r}, "match_percent": {percent}, '
+                f'"matches_all": {"true" if match else "false"}}}'
+                for j, distance, percent, match in zip(top_row, distance_row, percent_row, match_row))
+            outputs[i] = '{"id": ' + json.dumps(profile_id, ensure_ascii=False) + prefix + results + ']}'
+
+    return '\n'.join(outputs) + '\n'
+
+def iter_line_chunks(lines, size=BATCH_CHUNK_SIZE):
+    chunk = []
+    first_line = 1
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if not chunk:
+            first_line = number
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield first_line, chunk
+            chunk = []
+    if chunk:
+        yield first_line, chunk
+
+def run_batch(input_path, output_path, workers, k=MATCH_TOP_K):
+    with contextlib.redirect_stdout(sys.stderr):
+        snapshot = asyncio.run(load_catalog(generation=1))
+    if snapshot is None:
+        print("Не удалось получить данные о породах. Проверьте подключение к интернету и API ключ.", file=sys.stderr)
+        exit(-1)
 
-        if choice == '0':
-            break
-        elif choice == '1':
-            combined_breeds = []
-            max_len = max(len(breeds_cats), len(breeds_dogs))
-            for i in range(max_len):
-                if i < len(breeds_cats):
-                    combined_breeds.append(('cat', breeds_cats[i]))
-                if i < len(breeds_dogs):
-                    combined_breeds.append(('dog', breeds_dogs[i]))
-            await show_breeds_pages(combined_breeds)
-        elif choice == '2':
-            await pet_selection_test(breeds_cats, breeds_dogs)
+    source = sys.stdin if input_path == '-' else open(input_path, encoding='utf-8')
+    target = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8')
+    started = time.perf_counter()
+    profiles = 0
+    shm = None
+    try:
+        chunks = iter_line_chunks(source)
+        if workers <= 1:
+            init_batch_state(snapshot, k)
+            for first_line, lines in chunks:
+                target.write(match_profile_lines(first_line, lines))
+                profiles += len(lines)
         else:
-            print('Неверная команда')
-            input('Нажмите Enter чтобы продолжить...')
+            prefix = f'{SHM_PREFIX}-batch-{os.getpid()}'
+            shm = publish_snapshot(snapshot, prefix)
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_batch_worker, initargs=(prefix, 1, k)) as pool:
+                pending = deque()
+                for first_line, lines in chunks:
+                    pending.append(pool.submit(match_profile_lines, first_line, lines))
+                    profiles += len(lines)
+                    if len(pending) >= workers * 2:
+                        target.write(pending.popleft().result())
+                while pending:
+                    target.write(pending.popleft().result())
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+        else:
+            target.flush()
+    elapsed = time.perf_counter() - started
+    print(f"Обработано профилей: {profiles} за {elapsed:.1f} с ({profiles / max(elapsed, 1e-9):.0f}/с)", file=sys.stderr)
+
+def run_multiprocess_server(host, port, workers, access_log=False):
+    sock = socket.create_server((host, port), backlog=1024)
+    try:
+        asyncio.run(run_catalog_loader(sock, workers, access_log))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        sock.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Породы кошек и собак (api-ninjas)')
+    parser.add_argument('--serve', action='store_true', help='запустить HTTP-сервис вместо интерактивного меню')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='число процессов-обработчиков с общим каталогом в разделяемой памяти')
+    parser.add_argument('--access-log', action='store_true', help='писать журнал запросов (медленнее)')
+    parser.add_argument('--catalog', default=CATALOG_FILE, metavar='PATH',
+                        help='загрузить каталог из снимка вместо обращения к API')
+    parser.add_argument('--export-catalog', metavar='PATH', help='сохранить каталог в снимок и выйти')
+    parser.add_argument('--batch', nargs='?', const='-', metavar='PATH',
+                        help='подобрать породы для профилей из JSONL-файла (по умолчанию stdin)')
+    parser.add_argument('--batch-output', default='-', metavar='PATH', help='куда писать результаты JSONL')
+    parser.add_argument('--batch-workers', type=int, default=os.cpu_count() or 1,
+                        help='число процессов для пакетного подбора')
+    parser.add_argument('--top', type=int, default=MATCH_TOP_K, help='сколько пород возвращать на профиль')
+    args = parser.parse_args()
+    CATALOG_FILE = args.catalog
+
+    with profiling():
+        if args.export_catalog:
+            asyncio.run(export_catalog(args.export_catalog))
+        elif args.batch:
+            run_batch(args.batch, args.batch_output, args.batch_workers, args.top)
+        elif args.serve and args.workers > 1:
+            run_multiprocess_server(args.host, args.port, args.workers, args.access_log)
+        elif args.serve:
+            run_server(args.host, args.port, args.access_log)
+        else:
+            asyncio.run(main())
\ No newline at end of file
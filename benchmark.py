@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import aiohttp
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_fake_api(args, port):
+    command = [sys.executable, os.path.join(ROOT, 'fake_api.py'), '--port', str(port),
+               '--cats', str(args.cats), '--dogs', str(args.dogs),
+               '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_for_server(session, base_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(base_url + '/stats') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.05)
+
+async def fake_stats(session, base_url):
+    async with session.get(base_url + '/stats') as response:
+        return await response.json()
+
+def summarize(name, samples, elapsed, before, after):
+    latencies = np.array(samples, dtype=np.float64) * 1000
+    result = {
+        'name': name,
+        'operations': len(samples),
+        'seconds': round(elapsed, 4),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+        'requests': after['requests'] - before['requests'],
+        'not_modified': after['not_modified'] - before['not_modified'],
+        'upstream_errors': after['errors'] - before['errors']
+    }
+    for p in (50, 95, 99):
+        result[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 3) if len(samples) else None
+    return result
+
+class ScriptedInput:
+    def __init__(self, rnd, pages):
+        self.rnd = rnd
+        self.pages = pages
+        self.pages_left = pages
+        self.samples = []
+        self.answered_at = None
+
+    def restart(self):
+        self.pages_left = self.pages
+        self.answered_at = None
+
+    async def __call__(self, prompt=''):
+        if self.answered_at is not None:
+            self.samples.append(time.perf_counter() - self.answered_at)
+        if 'Ответ' in prompt:
+            answer = str(self.rnd.randint(1, 5))
+        elif 'Нажмите Enter' in prompt:
+            answer = ''
+        elif '1-След.' in prompt and self.pages_left > 0:
+            self.pages_left -= 1
+            answer = '1'
+        else:
+            answer = '0'
+        self.answered_at = time.perf_counter()
+        return answer
+
+@contextlib.contextmanager
+def scripted_terminal(app, responder):
+    ainput, system = app.ainput, os.system
+    app.ainput = responder
+    os.system = lambda command: 0
+    try:
+        yield
+    finally:
+        app.ainput = ainput
+        os.system = system
+
+def reset_catalog(app):
+    for species in app.breed_catalog:
+        app.breed_catalog[species].clear()
+
+async def run_benchmarks(args, base_url, cache_dir):
+    import CatAndDogAPI as app
+
+    rnd = random.Random(args.seed)
+    results = []
+    app.open_image_cache()
+    async with aiohttp.ClientSession() as stats_session, app.create_session() as session:
+        await wait_for_server(stats_session, base_url)
+
+        async def scenario(name, operations):
+            print(f"{name}...", file=sys.stderr)
+            samples = []
+            before = await fake_stats(stats_session, base_url)
+            started = time.perf_counter()
+            for operation in operations:
+                t = time.perf_counter()
+                await operation()
+                samples.append(time.perf_counter() - t)
+            elapsed = time.perf_counter() - started
+            results.append(summarize(name, samples, elapsed, before, await fake_stats(stats_session, base_url)))
+            return samples
+
+        async def fetch_cold(i):
+            app.close_breed_cache()
+            app.breed_cache = app.BreedCache(os.path.join(cache_dir, f'cold-{i}'))
+            reset_catalog(app)
+            await app.fetch_breeds(session)
+
+        await scenario('fetch_breeds_cold', [lambda i=i: fetch_cold(i) for i in range(args.rounds)])
+        await scenario('fetch_breeds_cached', [lambda: app.fetch_breeds(session)] * args.rounds)
+        await scenario('crawl_revalidate', [lambda: app.crawl_catalog(session)] * args.rounds)
+        breeds_cats, breeds_dogs = await app.fetch_breeds(session)
+
+        reset_catalog(app)
+        lookups = [('cat', breed) for breed in breeds_cats] + [('dog', breed) for breed in breeds_dogs]
+        del lookups[args.lookups:]
+        print('breed_lookups...', file=sys.stderr)
+        samples = []
+        before = await fake_stats(stats_session, base_url)
+        started = time.perf_counter()
+
+        async def lookup(species, breed):
+            t = time.perf_counter()
+            await app.get_breeds_async(session, [breed], is_cat=(species == 'cat'))
+            samples.append(time.perf_counter() - t)
+
+        await asyncio.gather(*(lookup(species, breed) for species, breed in lookups))
+        results.append(summarize('breed_lookups', samples, time.perf_counter() - started, before,
+                                 await fake_stats(stats_session, base_url)))
+        await app.fetch_breeds(session)
+
+        async def match(species, breeds):
+            client_answers = {trait: rnd.randint(1, 5) for trait, _, _ in app.MATCH_RULES[species]}
+            ranked_breeds, matching = await app.start_matching(session, species, breeds, client_answers)
+            await matching
+
+        await scenario('match_cats', [lambda: match('cat', breeds_cats)] * args.queries)
+        await scenario('match_dogs', [lambda: match('dog', breeds_dogs)] * args.queries)
+
+        for name, flow, breeds in (('cat_questions', app.cat_questions, breeds_cats),
+                                   ('dog_questions', app.dog_questions, breeds_dogs),
+                                   ('pager', None, None)):
+            responder = ScriptedInput(rnd, args.pages)
+            before = await fake_stats(stats_session, base_url)
+            started = time.perf_counter()
+            print(f"{name}...", file=sys.stderr)
+            with scripted_terminal(app, responder):
+                if flow is None:
+                    reset_catalog(app)
+                    combined_breeds = [('cat', breed) for breed in breeds_cats] + [('dog', breed) for breed in breeds_dogs]
+                    await app.show_breeds_pages(session, combined_breeds)
+                else:
+                    for _ in range(args.sessions):
+                        responder.restart()
+                        await flow(session, breeds)
+            results.append(summarize(name, responder.samples, time.perf_counter() - started, before,
+                                     await fake_stats(stats_session, base_url)))
+    await app.close_image_cache()
+    app.close_breed_cache()
+    return results
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    previous = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    regressions = []
+    for scenario in results['scenarios']:
+        old = previous.get(scenario['name'])
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if old[metric] is None or scenario[metric] is None:
+                continue
+            if scenario[metric] > old[metric] * (1 + tolerance) and scenario[metric] - old[metric] > min_delta_ms:
+                regressions.append(f"{scenario['name']}.{metric}: {old[metric]} -> {scenario[metric]}")
+        if scenario['requests'] > old['requests']:
+            regressions.append(f"{scenario['name']}.requests: {old['requests']} -> {scenario['requests']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк CatAndDogAPI на локальной заглушке api-ninjas')
+    parser.add_argument('--cats', type=int, default=70)
+    parser.add_argument('--dogs', type=int, default=350)
+    parser.add_argument('--latency', type=float, default=0.02, help='средняя задержка заглушки, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503 (0..1)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=3, help='повторов загрузки каталога')
+    parser.add_argument('--lookups', type=int, default=100, help='запросов пород по имени')
+    parser.add_argument('--queries', type=int, default=50, help='подборов по случайным ответам')
+    parser.add_argument('--sessions', type=int, default=5, help='сценариев опроса на вид')
+    parser.add_argument('--pages', type=int, default=30, help='страниц, пролистываемых за сценарий')
+    parser.add_argument('--output', help='файл для результатов (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='предыдущие результаты для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение p50/p95')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='игнорировать ухудшения меньше, мс')
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    cache_dir = tempfile.mkdtemp(prefix='catanddog-bench-')
+    os.environ.update({'API_BASE_URL': base_url, 'CACHE_DIR': os.path.join(cache_dir, 'main'), 'OFFLINE': '0'})
+    os.environ.setdefault('X_API_KEY', 'benchmark')
+    os.environ.setdefault('API_RATE_LIMIT', '1000')
+    os.environ.setdefault('API_RATE_BURST', '100')
+    os.environ.pop('CATALOG_FILE', None)
+    sys.path.insert(0, ROOT)
+
+    server = start_fake_api(args, port)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            scenarios = asyncio.run(run_benchmarks(args, base_url, cache_dir))
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'tolerance', 'min_delta_ms')},
+        'env': {key: os.environ[key] for key in ('API_RATE_LIMIT', 'API_RATE_BURST') if key in os.environ},
+        'scenarios': scenarios,
+        'peak_rss_kb': peak_rss_kb()
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"Регрессия: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import json
+import asyncio
+import hashlib
+import argparse
+import random
+from aiohttp import web
+
+PAGE_SIZE = 20
+
+stats_key = web.AppKey('stats', dict)
+
+CAT_TRAITS = ('shedding', 'family_friendly', 'playfulness', 'grooming',
+              'other_pets_friendly', 'children_friendly', 'intelligence', 'general_health')
+DOG_TRAITS = ('shedding', 'barking', 'energy', 'protectiveness', 'trainability',
+              'good_with_children', 'good_with_other_dogs', 'good_with_strangers',
+              'grooming', 'drooling', 'coat_length', 'playfulness')
+ORIGINS = ('United States', 'United Kingdom', 'France', 'Germany', 'Russia', 'Japan', 'Thailand', 'Egypt')
+
+IMAGE_BASE_URL = 'https://example.invalid'
+
+def make_cats(count, seed=1, image_base_url=IMAGE_BASE_URL):
+    rnd = random.Random(seed)
+    cats = []
+    for i in range(count):
+        min_weight = rnd.randint(4, 10)
+        min_life = rnd.randint(9, 13)
+        cat = {
+            'name': f'Fixture Cat {i + 1:04d}',
+            'image_link': f'{image_base_url}/images/cats/{i + 1}.ppm',
+            'length': f'{rnd.randint(12, 18)} to {rnd.randint(19, 24)} inches',
+            'origin': rnd.choice(ORIGINS),
+            'min_weight': min_weight,
+            'max_weight': min_weight + rnd.randint(2, 8),
+            'min_life_expectancy': min_life,
+            'max_life_expectancy': min_life + rnd.randint(2, 6)
+        }
+        for trait in CAT_TRAITS:
+            cat[trait] = rnd.randint(1, 5)
+        cats.append(cat)
+    return cats
+
+def make_dogs(count, seed=2, image_base_url=IMAGE_BASE_URL):
+    rnd = random.Random(seed)
+    dogs = []
+    for i in range(count):
+        height = rnd.randint(8, 28)
+        weight = rnd.randint(5, 90)
+        min_life = rnd.randint(8, 12)
+        dog = {
+            'name': f'Fixture Dog {i + 1:04d}',
+            'image_link': f'{image_base_url}/images/dogs/{i + 1}.ppm',
+            'min_height_male': height,
+            'max_height_male': height + rnd.randint(1, 4),
+            'min_weight_male': weight,
+            'max_weight_male': weight + rnd.randint(5, 20),
+            'min_height_female': height - 1,
+            'max_height_female': height + rnd.randint(0, 3),
+            'min_weight_female': max(weight - 5, 3),
+            'max_weight_female': weight + rnd.randint(0, 15),
+            'min_life_expectancy': min_life,
+            'max_life_expectancy': min_life + rnd.randint(2, 5)
+        }
+        for trait in DOG_TRAITS:
+            dog[trait] = rnd.randint(1, 5)
+        dogs.append(dog)
+    return dogs
+
+def json_response(request, data):
+    body = json.dumps(data).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+def breeds_handler(breeds, page_size):
+    by_name = {breed['name'].casefold(): breed for breed in breeds}
+
+    async def handler(request):
+        name = request.query.get('name')
+        if name is not None:
+            breed = by_name.get(name.strip().casefold())
+            return json_response(request, [breed] if breed else [])
+        offset = int(request.query.get('offset', 0))
+        return json_response(request, breeds[offset:offset + page_size])
+
+    return handler
+
+def create_app(cats, dogs, page_size=PAGE_SIZE, latency=0.0, error_rate=0.0, seed=None, image_size=32 * 1024):
+    app = web.Application()
+    app[stats_key] = {'requests': 0, 'errors': 0, 'not_modified': 0}
+    rnd = random.Random(seed)
+
+    @web.middleware
+    async def simulate_upstream(request, handler):
+        if request.path == '/stats':
+            return await handler(request)
+        app[stats_key]['requests'] += 1
+        if latency:
+            await asyncio.sleep(rnd.uniform(latency / 2, latency * 1.5))
+        if rnd.random() < error_rate:
+            app[stats_key]['errors'] += 1
+            return web.Response(status=503, text='Service Unavailable')
+        response = await handler(request)
+        if response.status == 304:
+            app[stats_key]['not_modified'] += 1
+        return response
+
+    side = max(1, int((image_size / 3) ** 0.5))
+
+    async def image_handler(request):
+        rnd_image = random.Random(request.match_info['kind'] + request.match_info['number'])
+        body = f'P6 {side} {side} 255\n'.encode() + rnd_image.randbytes(side * side * 3)
+        return web.Response(body=body, content_type='image/x-portable-pixmap')
+
+    async def stats_handler(request):
+        return web.json_response(app[stats_key])
+
+    app.middlewares.append(simulate_upstream)
+    app.router.add_get('/v1/cats', breeds_handler(cats, page_size))
+    app.router.add_get('/v1/dogs', breeds_handler(dogs, page_size))
+    app.router.add_get('/images/{kind}/{number}.ppm', image_handler)
+    app.router.add_get('/stats', stats_handler)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальная заглушка api-ninjas /v1/cats и /v1/dogs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cats', type=int, default=70)
+    parser.add_argument('--dogs', type=int, default=350)
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--latency', type=float, default=0.0, help='средняя задержка ответа, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503 (0..1)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--image-size', type=int, default=32 * 1024, help='размер отдаваемых картинок, байт')
+    args = parser.parse_args()
+
+    base_url = f'http://{args.host}:{args.port}'
+    web.run_app(create_app(make_cats(args.cats, image_base_url=base_url), make_dogs(args.dogs, image_base_url=base_url),
+                           args.page_size, args.latency, args.error_rate, args.seed, args.image_size),
+                host=args.host, port=args.port)
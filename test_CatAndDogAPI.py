@@ -0,0 +1,459 @@
+import os
+import time
+import json
+import asyncio
+import contextlib
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+os.environ.setdefault('X_API_KEY', 'test')
+
+import fake_api
+import CatAndDogAPI as app
+
+class FakeContent:
+    def __init__(self, data, step):
+        self.data = data
+        self.step = step
+
+    async def chunks(self):
+        for i in range(0, len(self.data), self.step):
+            yield self.data[i:i + self.step]
+
+    def iter_chunked(self, size):
+        return self.chunks()
+
+@pytest.fixture(autouse=True)
+def fast_scheduler(monkeypatch):
+    monkeypatch.setattr(app, 'scheduler', app.RequestScheduler(rate=1000, burst=100, max_retries=0, backoff_base=0.01))
+    monkeypatch.setattr(app, 'breed_cache', None)
+
+@contextlib.asynccontextmanager
+async def fake_upstream(monkeypatch, cats, dogs, middleware=None, **options):
+    fake = fake_api.create_app(cats, dogs, **options)
+    if middleware is not None:
+        fake.middlewares.append(middleware)
+    server = TestServer(fake)
+    await server.start_server()
+    monkeypatch.setattr(app, 'api_url_cats', str(server.make_url('/v1/cats')))
+    monkeypatch.setattr(app, 'api_url_dogs', str(server.make_url('/v1/dogs')))
+    try:
+        async with aiohttp.ClientSession(headers=app.HEADERS) as session:
+            yield fake, session
+    finally:
+        await server.close()
+
+def crawl(monkeypatch, cats, dogs, species, budget=10, middleware=None, **options):
+    async def run():
+        async with fake_upstream(monkeypatch, cats, dogs, middleware, **options) as (fake, session):
+            deadline = asyncio.get_running_loop().time() + budget
+            breeds, complete = await app.crawl_breeds(session, species, deadline)
+            return breeds, complete, fake[fake_api.stats_key]['requests']
+    return asyncio.run(run())
+
+def test_crawl_stops_on_short_page(monkeypatch):
+    cats = fake_api.make_cats(70)
+    breeds, complete, requests = crawl(monkeypatch, cats, [], 'cat')
+    assert complete
+    assert [breed.name for breed in breeds] == [cat['name'] for cat in cats]
+    assert requests == 4
+
+def test_crawl_dedupes_by_name(monkeypatch):
+    cats = fake_api.make_cats(30)
+    duplicates = [dict(cat, name=cat['name'].upper()) for cat in cats[:5]]
+    breeds, complete, _ = crawl(monkeypatch, cats[:20] + duplicates + cats[20:], [], 'cat')
+    assert complete
+    assert [breed.name for breed in breeds] == [cat['name'] for cat in cats]
+
+def test_crawl_time_budget_marks_incomplete(monkeypatch):
+    breeds, complete, _ = crawl(monkeypatch, [], fake_api.make_dogs(100), 'dog', budget=0.05, latency=0.5)
+    assert not complete
+    assert breeds == []
+
+def test_crawl_failing_page_marks_incomplete(monkeypatch):
+    @web.middleware
+    async def fail_page(request, handler):
+        if request.path == '/v1/dogs' and request.query.get('offset') == '40':
+            return web.Response(status=503, text='Service Unavailable')
+        return await handler(request)
+
+    dogs = fake_api.make_dogs(100)
+    breeds, complete, _ = crawl(monkeypatch, [], dogs, 'dog', middleware=fail_page)
+    assert not complete
+    assert [breed.name for breed in breeds] == [dog['name'] for dog in dogs[:40] + dogs[60:80]]
+
+def test_crawl_failing_first_page_raises(monkeypatch):
+    @web.middleware
+    async def fail_page(request, handler):
+        if request.query.get('offset') == '0':
+            return web.Response(status=503, text='Service Unavailable')
+        return await handler(request)
+
+    with pytest.raises(app.ApiError):
+        crawl(monkeypatch, fake_api.make_cats(30), [], 'cat', middleware=fail_page)
+
+def test_partial_catalog_is_not_cached(monkeypatch, tmp_path):
+    cache = app.BreedCache(str(tmp_path))
+    monkeypatch.setattr(app, 'breed_cache', cache)
+
+    async def run(budget, **options):
+        async with fake_upstream(monkeypatch, fake_api.make_cats(30), fake_api.make_dogs(30), **options) as (_, session):
+            return await app.crawl_catalog(session, budget)
+
+    try:
+        _, _, complete = asyncio.run(run(0.05, latency=0.5))
+        assert not complete
+        assert cache.load_breeds('cat') is None
+        breeds_cats, breeds_dogs, complete = asyncio.run(run(10))
+        assert complete
+        assert len(cache.load_breeds('cat')) == len(breeds_cats) == 30
+        assert len(cache.load_breeds('dog')) == len(breeds_dogs) == 30
+    finally:
+        cache.close()
+
+def test_get_json_cached_revalidates_with_etag(monkeypatch, tmp_path):
+    cache = app.BreedCache(str(tmp_path))
+    monkeypatch.setattr(app, 'breed_cache', cache)
+
+    async def run():
+        async with fake_upstream(monkeypatch, fake_api.make_cats(30), []) as (fake, session):
+            first = await app.get_json_cached(session, app.api_url_cats, {'offset': 0})
+            second = await app.get_json_cached(session, app.api_url_cats, {'offset': 0})
+            return first, second, fake[fake_api.stats_key]
+
+    try:
+        first, second, stats = asyncio.run(run())
+        assert first == second
+        assert len(first) == 20
+        assert stats['requests'] == 2
+        assert stats['not_modified'] == 1
+    finally:
+        cache.close()
+
+def test_breed_cache_ttl(tmp_path):
+    cache = app.BreedCache(str(tmp_path), ttl=60)
+    try:
+        breeds = [app.parse_breed('cat', info) for info in fake_api.make_cats(3)]
+        cache.save_breeds('cat', breeds)
+        assert [breed for breed, _ in cache.load_breeds('cat')] == breeds
+        assert cache.load_breeds('dog') is None
+        cache.ttl = -1
+        assert cache.load_breeds('cat') is None
+        assert [breed for breed, _ in cache.load_breeds('cat', allow_stale=True)] == breeds
+    finally:
+        cache.close()
+
+def test_catalog_get_ttl(monkeypatch):
+    monkeypatch.setattr(app, 'breed_catalog', {'cat': {}, 'dog': {}})
+    monkeypatch.setattr(app, 'breed_search', app.BreedSearchIndex())
+    fresh = app.CatBreed(name='Persian')
+    stale = app.CatBreed(name='Siamese')
+    app.catalog_put('cat', fresh)
+    app.catalog_put('cat', stale, fetched_at=time.time() - app.CATALOG_TTL - 1)
+
+    assert app.catalog_get('cat', 'persian') is fresh
+    assert app.catalog_get('cat', 'Siamese') is None
+    assert app.catalog_get('cat', 'Siamese', allow_stale=True) is stale
+
+def test_read_line_decodes_console_bytes():
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, 'Сиамская\r\nда\nлишнее'.encode('cp866'))
+        os.close(write_fd)
+        buffer = bytearray()
+        assert app._read_line(read_fd, buffer, 'cp866') == 'Сиамская'
+        assert app._read_line(read_fd, buffer, 'cp866') == 'да'
+        assert app._read_line(read_fd, buffer, 'cp866') == 'лишнее'
+        with pytest.raises(EOFError):
+            app._read_line(read_fd, buffer, 'cp866')
+    finally:
+        os.close(read_fd)
+
+def scheduled_requests(scheduler, responses):
+    # replays (status, headers) pairs, repeating the last one
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        status, headers = responses[min(len(calls), len(responses)) - 1]
+        return web.json_response({'status': status}, status=status, headers=headers)
+
+    async def handle(response):
+        return await response.json()
+
+    async def run():
+        fake = web.Application()
+        fake.router.add_get('/v1/cats', handler)
+        server = TestServer(fake)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await scheduler.request(session, str(server.make_url('/v1/cats')), handle)
+        finally:
+            await server.close()
+
+    return run, calls
+
+def test_parse_retry_after():
+    assert app.parse_retry_after('2') == 2.0
+    assert app.parse_retry_after('-5') == 0.0
+    assert app.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert app.parse_retry_after('soon') is None
+    assert app.parse_retry_after(None) is None
+
+def test_scheduler_retries_server_errors():
+    scheduler = app.RequestScheduler(rate=1000, burst=100, max_retries=3, backoff_base=0.001)
+    run, calls = scheduled_requests(scheduler, [(503, {}), (502, {}), (200, {})])
+    assert asyncio.run(run()) == {'status': 200}
+    assert len(calls) == 3
+    assert scheduler.breaker.failures == 0
+
+def test_scheduler_gives_up_after_max_retries():
+    scheduler = app.RequestScheduler(rate=1000, burst=100, max_retries=2, backoff_base=0.001)
+    run, calls = scheduled_requests(scheduler, [(503, {})])
+    with pytest.raises(app.ApiError):
+        asyncio.run(run())
+    assert len(calls) == 3
+
+def test_scheduler_honours_retry_after():
+    scheduler = app.RequestScheduler(rate=1000, burst=100, max_retries=1, backoff_base=0.001)
+    run, calls = scheduled_requests(scheduler, [(429, {'Retry-After': '0.3'}), (200, {})])
+    start = time.monotonic()
+    assert asyncio.run(run()) == {'status': 200}
+    assert time.monotonic() - start >= 0.3
+    assert len(calls) == 2
+    assert scheduler.breaker.failures == 0
+
+def test_scheduler_open_circuit_rejects_requests():
+    scheduler = app.RequestScheduler(rate=1000, burst=100, max_retries=5, backoff_base=0.001)
+    scheduler.breaker = app.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    run, calls = scheduled_requests(scheduler, [(503, {})])
+    with pytest.raises(app.CircuitOpenError):
+        asyncio.run(run())
+    assert len(calls) == 2
+
+def test_circuit_breaker_half_open_allows_one_probe():
+    breaker = app.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+@pytest.fixture
+def empty_catalog(monkeypatch):
+    monkeypatch.setattr(app, 'breed_catalog', {'cat': {}, 'dog': {}})
+    monkeypatch.setattr(app, 'breed_search', app.BreedSearchIndex())
+    monkeypatch.setattr(app, 'OFFLINE', False)
+
+def test_concurrent_lookups_share_one_request(monkeypatch, empty_catalog):
+    cats = fake_api.make_cats(30)
+    name = cats[7]['name']
+
+    async def run():
+        async with fake_upstream(monkeypatch, cats, [], latency=0.1) as (fake, session):
+            names = [name, name.upper(), f'  {name.lower()} '] * 5
+            breeds = await asyncio.gather(*(app.get_breed_record(session, 'cat', n) for n in names))
+            return breeds, fake[fake_api.stats_key]['requests']
+
+    breeds, requests = asyncio.run(run())
+    assert requests == 1
+    assert all(breed is breeds[0] for breed in breeds)
+    assert breeds[0].name == name
+    assert app.inflight_lookups == {}
+
+def test_cancelled_waiter_keeps_shared_lookup(monkeypatch, empty_catalog):
+    cats = fake_api.make_cats(30)
+    name = cats[3]['name']
+
+    async def run():
+        async with fake_upstream(monkeypatch, cats, [], latency=0.1) as (fake, session):
+            first = asyncio.create_task(app.lookup_breed(session, 'cat', name))
+            second = asyncio.create_task(app.lookup_breed(session, 'cat', name))
+            await asyncio.sleep(0.02)
+            first.cancel()
+            breed = await second
+            return first, breed, fake[fake_api.stats_key]['requests']
+
+    first, breed, requests = asyncio.run(run())
+    assert first.cancelled()
+    assert breed.name == name
+    assert requests == 1
+
+def test_unknown_breed_gets_placeholder(monkeypatch, empty_catalog):
+    async def run():
+        async with fake_upstream(monkeypatch, fake_api.make_cats(30), []) as (_, session):
+            return await app.get_breed_record(session, 'cat', 'Fixture Cat')
+
+    breed = asyncio.run(run())
+    assert breed == app.CatBreed(name='Fixture Cat')
+    assert app.catalog_get('cat', 'Fixture Cat') is None
+
+def test_refresh_is_staged_until_published(monkeypatch, empty_catalog):
+    cats, dogs = fake_api.make_cats(30), fake_api.make_dogs(30)
+    snapshot = app.CatalogSnapshot.from_lists([app.parse_breed('cat', info) for info in cats],
+                                              [app.parse_breed('dog', info) for info in dogs])
+    app.publish_catalog(snapshot)
+    name = cats[5]['name']
+    live = app.catalog_get('cat', name)
+    changed = [dict(cat, shedding=cat['shedding'] % 5 + 1, origin='Atlantis') for cat in cats]
+
+    @web.middleware
+    async def fail_page(request, handler):
+        if request.path == '/v1/dogs' and request.query.get('offset') == '20':
+            return web.Response(status=503, text='Service Unavailable')
+        return await handler(request)
+
+    async def run(middleware=None):
+        async with fake_upstream(monkeypatch, changed, dogs, middleware) as (_, session):
+            return await app.refresh_snapshot(session, snapshot)
+
+    assert asyncio.run(run(fail_page)) is None
+    assert app.catalog_get('cat', name) is live
+    assert app.breed_search.search('atlantis') == []
+
+    refreshed = asyncio.run(run())
+    assert refreshed is not snapshot
+    assert app.catalog_get('cat', name) is live
+
+    app.publish_catalog(refreshed)
+    assert app.catalog_get('cat', name) == refreshed.find('cat', name) != live
+    assert app.breed_search.search('atlantis')[0][2].origin == 'Atlantis'
+
+async def collect(content, key=None):
+    return [item async for item in app.iter_json_array(content, key)]
+
+@pytest.mark.parametrize('step', [1, 3, 7, 1024])
+def test_iter_json_array_chunk_boundaries(step):
+    items = [{'name': 'Сиамская', 'n': i, 'tags': ['a, b', ']']} for i in range(5)]
+    data = json.dumps(items, ensure_ascii=False, indent=1).encode()
+    assert asyncio.run(collect(FakeContent(data, step))) == items
+
+def test_iter_json_array_wrapped_object():
+    data = json.dumps({'cats': [{'name': 'a'}, {'name': 'b'}]}).encode()
+    assert asyncio.run(collect(FakeContent(data, 5), 'cats')) == [{'name': 'a'}, {'name': 'b'}]
+
+def test_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        asyncio.run(collect(FakeContent(b'[{"name": "a"}, {"na', 4)))
+
+def fixture_snapshot():
+    breeds_cats = [app.parse_breed('cat', info) for info in fake_api.make_cats(40)]
+    breeds_dogs = [app.parse_breed('dog', info) for info in fake_api.make_dogs(60)]
+    return app.CatalogSnapshot.from_lists(breeds_cats, breeds_dogs)
+
+CAT_ANSWERS = {'shedding': 2, 'family_friendly': 3, 'playfulness': 4, 'grooming': 2, 'general_health': 3}
+
+def test_snapshot_file_roundtrip(tmp_path):
+    snapshot = fixture_snapshot()
+    path = str(tmp_path / 'catalog.snap')
+    app.export_snapshot(snapshot, path)
+    _, loaded, _ = app.import_snapshot(path)
+
+    assert list(loaded.breeds['dog']) == snapshot.breeds['dog']
+    assert loaded.find('cat', 'fixture cat 0007') == snapshot.find('cat', 'Fixture Cat 0007')
+    assert loaded.indexes['cat'].rank(CAT_ANSWERS) == snapshot.indexes['cat'].rank(CAT_ANSWERS)
+
+def test_read_snapshot_rejects_damaged_files(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    app.export_snapshot(fixture_snapshot(), path)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    for damaged in (data[:-100], data[:len(data) // 2], data[:20], b'XXXXXXXX' + data[8:]):
+        with pytest.raises(ValueError):
+            app.read_snapshot(memoryview(damaged))
+
+def test_loaded_snapshot_is_fresh_until_refresh(monkeypatch, empty_catalog, tmp_path):
+    monkeypatch.setattr(app, 'trait_indexes', {})
+    monkeypatch.setattr(app, 'catalog_files', [])
+    path = str(tmp_path / 'catalog.snap')
+    app.export_snapshot(fixture_snapshot(), path)
+    import_snapshot = app.import_snapshot
+    monkeypatch.setattr(app, 'import_snapshot',
+                        lambda path: (*import_snapshot(path)[:2], time.time() - 2 * app.CATALOG_TTL))
+
+    snapshot = app.load_catalog_file(path)
+    try:
+        assert app.catalog_get('cat', 'Fixture Cat 0007') == snapshot.find('cat', 'Fixture Cat 0007')
+        assert app.catalog_get('dog', 'Fixture Dog 0042') is not None
+        assert app.breed_search.search('fixture cat 0007')[0][2].name == 'Fixture Cat 0007'
+    finally:
+        snapshot = None
+        app.close_catalog_files()
+
+def test_match_profile_lines(monkeypatch):
+    monkeypatch.setattr(app, 'batch_state', None)
+    snapshot = fixture_snapshot()
+    app.init_batch_state(snapshot, 3)
+    lines = [
+        json.dumps({'id': 'a', 'species': 'cat', 'answers': CAT_ANSWERS}),
+        json.dumps({'species': 'cat', **CAT_ANSWERS}),
+        'not json',
+        json.dumps({'species': ['cat']}),
+        json.dumps({'species': 'cat', 'answers': 5}),
+        json.dumps([1, 2]),
+        json.dumps({'species': 'dog', 'answers': CAT_ANSWERS}),
+        json.dumps({'species': 'cat', 'answers': dict(CAT_ANSWERS, shedding=9)})
+    ]
+    outputs = [json.loads(line) for line in app.match_profile_lines(10, lines).splitlines()]
+
+    assert [output['id'] for output in outputs] == ['a', 11, 12, 13, 14, 15, 16, 17]
+    expected = [breed.name for _, breed in snapshot.indexes['cat'].rank(CAT_ANSWERS, 3)]
+    for output in outputs[:2]:
+        assert [result['name'] for result in output['results']] == expected
+    assert all('error' in output for output in outputs[2:])
+
+@pytest.mark.parametrize('k, expected', [(-3, 1), (0, 1), (2, 2), (1000, 40)])
+def test_match_profile_lines_clamps_top(monkeypatch, k, expected):
+    monkeypatch.setattr(app, 'batch_state', None)
+    app.init_batch_state(fixture_snapshot(), k)
+    line = json.dumps({'species': 'cat', 'answers': CAT_ANSWERS})
+    output = json.loads(app.match_profile_lines(0, [line]))
+    assert len(output['results']) == expected
+
+def test_breed_search_index():
+    index = app.BreedSearchIndex()
+    index.add('cat', app.CatBreed(name='Persian', origin='Iran'))
+    index.add('cat', app.CatBreed(name='Siamese', origin='Thailand'))
+    index.add('dog', app.DogBreed(name='German Shepherd'))
+    index.add('dog', app.DogBreed(name='Shetland Sheepdog'))
+
+    assert index.search('germn shephard')[0][2].name == 'German Shepherd'
+    assert {breed.name for _, _, breed in index.search('shep')} >= {'German Shepherd'}
+    assert index.search('thailand')[0][2].name == 'Siamese'
+    assert all(species == 'cat' for _, species, _ in index.search('s', species='cat'))
+    assert index.search('') == []
+
+    index.retain({'cat': {'siamese': 0}, 'dog': {'german shepherd': 0}})
+    assert len(index) == 2
+    assert index.search('persian') == []
+    assert index.search('shetland') == []
+
+def test_index_snapshot_keeps_rows_of_shared_records(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'breed_search', app.BreedSearchIndex())
+    path = str(tmp_path / 'catalog.snap')
+    app.export_snapshot(fixture_snapshot(), path)
+    _, first, _ = app.import_snapshot(path)
+    _, second, _ = app.import_snapshot(path)
+
+    app.index_snapshot(first)
+    app.index_snapshot(second)
+    assert len(app.breed_search) == 100
+    assert all(breeds is second.breeds[species] for species, breeds, _ in app.breed_search.entries)
+    assert app.breed_search.search('fixture dog 0042')[0][1:] == ('dog', second.find('dog', 'Fixture Dog 0042'))
+